@@ -0,0 +1,144 @@
+from Int16Converter import Int16Converter
+from Float32Converter import Float32Converter
+
+
+def create_converter(sample_format, block_size=256, channels=1):
+    # Conversion between device data and the float32 pipeline
+    if sample_format == "float32":
+        return Float32Converter(block_size, channels)
+    return Int16Converter(block_size, channels)
+
+
+class AudioBackend:
+    # Streams follow the PyAudio stream API: read(), write(), stop_stream(),
+    # get_input_latency() and get_output_latency(). Stream callbacks take
+    # (in_data, frame_count, time_info, status) and return the output data.
+
+    def open_stream(
+        self,
+        rate,
+        channels=1,
+        sample_format="int16",
+        input=False,
+        output=False,
+        input_device_index=None,
+        output_device_index=None,
+        frames_per_buffer=256,
+        stream_callback=None,
+    ):
+        raise NotImplementedError
+
+    def release_stream(self, stream):
+        raise NotImplementedError
+
+    def is_format_supported(
+        self,
+        sample_format,
+        rate,
+        channels=1,
+        input=False,
+        output=False,
+        input_device_index=None,
+        output_device_index=None,
+    ):
+        return True
+
+    def terminate(self):
+        pass
+
+
+class PyAudioBackend(AudioBackend):
+    def __init__(self):
+        from DeviceManager import get_device_manager
+
+        self.device_manager = get_device_manager()
+
+        # wrappers are reused, so a restarted stream matches its idle stream
+        self.stream_callbacks = {}
+
+    def open_stream(
+        self,
+        rate,
+        channels=1,
+        sample_format="int16",
+        input=False,
+        output=False,
+        input_device_index=None,
+        output_device_index=None,
+        frames_per_buffer=256,
+        stream_callback=None,
+    ):
+        import pyaudio
+
+        formats = {"int16": pyaudio.paInt16, "float32": pyaudio.paFloat32}
+
+        return self.device_manager.open_stream(
+            format=formats[sample_format],
+            channels=channels,
+            rate=rate,
+            input=input,
+            output=output,
+            input_device_index=input_device_index,
+            output_device_index=output_device_index,
+            frames_per_buffer=frames_per_buffer,
+            stream_callback=self._wrap_callback(stream_callback),
+        )
+
+    def release_stream(self, stream):
+        self.device_manager.release_stream(stream)
+
+    def is_format_supported(
+        self,
+        sample_format,
+        rate,
+        channels=1,
+        input=False,
+        output=False,
+        input_device_index=None,
+        output_device_index=None,
+    ):
+        import pyaudio
+
+        audio = self.device_manager.pyaudio
+        formats = {"int16": pyaudio.paInt16, "float32": pyaudio.paFloat32}
+
+        try:
+            if input:
+                if input_device_index is None:
+                    input_device_index = audio.get_default_input_device_info()["index"]
+
+                return audio.is_format_supported(
+                    rate,
+                    input_device=input_device_index,
+                    input_channels=channels,
+                    input_format=formats[sample_format],
+                )
+
+            if output_device_index is None:
+                output_device_index = audio.get_default_output_device_info()["index"]
+
+            return audio.is_format_supported(
+                rate,
+                output_device=output_device_index,
+                output_channels=channels,
+                output_format=formats[sample_format],
+            )
+
+        except (IOError, ValueError):
+            # PyAudio raises instead of returning False
+            return False
+
+    def _wrap_callback(self, stream_callback):
+        if stream_callback is None:
+            return None
+
+        if stream_callback not in self.stream_callbacks:
+            import pyaudio
+
+            def pyaudio_callback(in_data, frame_count, time_info, status):
+                data = stream_callback(in_data, frame_count, time_info, status)
+                return (data, pyaudio.paContinue)
+
+            self.stream_callbacks[stream_callback] = pyaudio_callback
+
+        return self.stream_callbacks[stream_callback]
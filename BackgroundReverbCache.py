@@ -0,0 +1,226 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from BackgroundTrack import BackgroundTrack
+from Playlist import Playlist
+
+
+class BackgroundReverbCache:
+    def __init__(
+        self,
+        sample_rate=44100,
+        channels=1,
+        track_cache=None,
+        memory_budget=256 * 1024**2,
+        tail_seconds=10.0,
+    ):
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+        # streamed tracks are rendered from their cached copies
+        self.track_cache = track_cache
+
+        # the reverb runs over this much of the loop before the rendered
+        # part, so the tail is wrapped across the loop point
+        self.tail_length = int(tail_seconds * sample_rate)
+
+        # rendered loops (frames, channels) in least recently used order
+        self.renders = OrderedDict()
+        self.memory_budget = memory_budget
+        self.memory_size = 0
+        self.lock = threading.Lock()
+
+        # (playlist layout, room size, rendered track) the audio thread serves
+        self.current = None
+
+        # the latest render request, a newer request replaces an older one
+        self.requested_key = None
+        self.request = None
+        self.condition = threading.Condition()
+        self.thread = None
+
+        # statistics
+        self.render_count = 0
+        self.render_time = 0
+        self.error_count = 0
+        self.last_error = None
+
+    # ----------------------------------------------------------------
+    def update(self, playlist, file_paths, level, room_size):
+        # Called on every change of the tracks, the crossfade or the room size
+        layout = playlist.layout
+        tracks = layout[0]
+
+        # streamed tracks are measured while playing, their gain comes with
+        # the cached copy
+        gains = tuple(
+            track.audio_gain if hasattr(track, "audio_data") else None
+            for track in tracks
+        )
+        key = (tuple(file_paths), gains, playlist.crossfade_length, level, room_size)
+
+        with self.lock:
+            loop = self.renders.get(key)
+            if loop is not None:
+                self.renders.move_to_end(key)
+
+        with self.condition:
+            self.requested_key = key
+            self.current = None
+
+            # Loops larger than the budget are never rendered, the live
+            # reverb processes them
+            size = layout[4] * self.channels * 4
+
+            if loop is not None:
+                self.current = (layout, room_size, self._create_track(loop))
+            elif tracks and size <= self.memory_budget:
+                self.request = (key, layout, list(file_paths), level, room_size)
+                self.condition.notify()
+
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, daemon=True)
+                    self.thread.start()
+
+    def get_track(self, layout, room_size):
+        # Called by the audio thread, None while a new render is in progress
+        current = self.current
+        if current is None or current[0] is not layout or current[1] != room_size:
+            return None
+        return current[2]
+
+    def set_memory_budget(self, memory_budget):
+        with self.lock:
+            self.memory_budget = memory_budget
+            self._evict(0)
+
+    def _evict(self, size):
+        while self.renders and self.memory_size + size > self.memory_budget:
+            _, loop = self.renders.popitem(last=False)
+            self.memory_size -= loop.nbytes
+
+    def _create_track(self, loop):
+        return BackgroundTrack(loop, 1.0, self.channels)
+
+    # ----------------------------------------------------------------
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.request is None:
+                    self.condition.wait()
+                request = self.request
+
+            # A moving slider is rendered once it stops
+            time.sleep(0.25)
+
+            with self.condition:
+                if self.request is not request:
+                    continue
+                self.request = None
+
+            key, layout, file_paths, level, room_size = request
+            start_time = time.perf_counter()
+
+            try:
+                loop = self._render(layout, file_paths, key[2], level, room_size)
+            except Exception as error:
+                self.error_count += 1
+                self.last_error = f"{type(error).__name__}: {error}"
+                continue
+
+            if loop is None:
+                continue
+
+            self.render_count += 1
+            self.render_time = time.perf_counter() - start_time
+
+            with self.lock:
+                if loop.nbytes > self.memory_budget:
+                    # Too long to keep, the loop is processed live
+                    continue
+
+                self._evict(loop.nbytes)
+                self.renders[key] = loop
+                self.memory_size += loop.nbytes
+
+            with self.condition:
+                if self.requested_key == key:
+                    self.current = (layout, room_size, self._create_track(loop))
+
+    def _render(
+        self, layout, file_paths, crossfade_length, level, room_size, block_size=4096
+    ):
+        from pedalboard import Reverb
+
+        tracks, _, _, _, length = layout
+
+        # Copies of the tracks, read from the start without touching playback
+        playlist = Playlist(sample_rate=self.sample_rate, channels=self.channels)
+        playlist.crossfade_length = crossfade_length
+
+        for track, file_path in zip(tracks, file_paths):
+            cached_audio = self._get_audio_data(track, file_path)
+            if cached_audio is None:
+                return None
+
+            audio_data, audio_koeff = cached_audio
+            playlist.add_track(BackgroundTrack(audio_data, audio_koeff, self.channels))
+
+        # One pass of the loop, matched to the length of the playing tracks;
+        # from the second pass on, the first track starts faded in. The loop
+        # is the only full-length array, the reverb works on it in place
+        loop = np.zeros((length, self.channels), dtype=np.float32)
+        count = min(length, playlist.length)
+        playlist.advance(playlist.length)
+
+        for start in range(0, count, block_size):
+            frame_count = min(block_size, count - start)
+            loop[start : start + frame_count] = playlist.read(frame_count, level).T
+            playlist.advance(frame_count)
+
+        # The end of the loop runs first, so its tail lands on the start
+        indices = np.arange(-self.tail_length, 0) % length
+        reverb = Reverb(room_size=room_size)
+        for start in range(0, self.tail_length, block_size):
+            block = loop[indices[start : start + block_size]].T
+            reverb(block, self.sample_rate, reset=False)
+
+        for start in range(0, length, block_size):
+            block = np.ascontiguousarray(loop[start : start + block_size].T)
+            loop[start : start + block_size] = reverb(
+                block, self.sample_rate, reset=False
+            ).T
+
+        loop.setflags(write=False)
+        return loop
+
+    def _get_audio_data(self, track, file_path):
+        audio_data = getattr(track, "audio_data", None)
+        if audio_data is not None:
+            return audio_data, 1 / track.audio_gain
+
+        # Streamed tracks are rendered once the track cache holds them, with
+        # the peak they are normalized by
+        mono = self.channels == 1
+        while self.request is None:
+            cached_audio = self.track_cache.load(file_path, self.sample_rate, mono)
+            if cached_audio is not None:
+                return cached_audio
+            time.sleep(0.5)
+
+        # A newer request is waiting
+        return None
+
+    # ----------------------------------------------------------------
+    def get_stats(self):
+        return {
+            "renders": len(self.renders),
+            "memory_bytes": self.memory_size,
+            "memory_budget": self.memory_budget,
+            "serving": self.current is not None,
+            "render_count": self.render_count,
+            "render_time": self.render_time,
+            "errors": self.error_count,
+            "last_error": self.last_error,
+        }
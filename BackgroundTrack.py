@@ -0,0 +1,77 @@
+import numpy as np
+
+
+class BackgroundTrack:
+    def __init__(self, audio_data, audio_koeff=None, channels=None):
+        # audio_data may be a read-only memory-mapped array, it is never copied;
+        # it is (frames,) or (frames, channels)
+        audio_data = np.asarray(audio_data, dtype=np.float32)
+        if audio_data.ndim == 1:
+            audio_data = audio_data.reshape(-1, 1)
+
+        # Mono tracks are spread over all channels when read, extra
+        # channels are mixed down once
+        self.channels = channels or audio_data.shape[1]
+        if audio_data.shape[1] > self.channels:
+            audio_data = audio_data.mean(axis=1, keepdims=True)
+
+        # Normalize once, not on every chunk
+        if audio_koeff is None:
+            audio_koeff = np.max(np.abs(audio_data)) if len(audio_data) else 0
+        self.audio_gain = 1 / audio_koeff if audio_koeff > 0 else 1
+
+        self.audio_data = audio_data
+        self.length = len(audio_data)
+
+        # playback position in samples
+        self.position = 0
+
+        self.output_buffer = np.zeros((self.channels, 0), dtype=np.float32)
+
+    # ----------------------------------------------------------------
+    def seek(self, position):
+        if self.length:
+            self.position = int(position) % self.length
+
+    def advance(self, frame_count):
+        self.seek(self.position + frame_count)
+
+    def set_position_percent(self, percent):
+        self.seek(self.length * percent / 100)
+
+    def get_position_percent(self):
+        if not self.length:
+            return 0
+        return self.position / self.length * 100
+
+    def close(self):
+        pass
+
+    # ----------------------------------------------------------------
+    def read(self, frame_count, volume=1.0, offset=0):
+        if self.output_buffer.shape[1] < frame_count:
+            self.output_buffer = np.zeros(
+                (self.channels, frame_count), dtype=np.float32
+            )
+
+        # Planar (channels, frames) output
+        output_data = self.output_buffer[:, :frame_count]
+        if not self.length:
+            output_data.fill(0)
+            return output_data
+
+        # Copy the ring buffer slice, wrapping around at the loop point
+        volume *= self.audio_gain
+        position = (self.position + offset) % self.length
+        filled = 0
+        while filled < frame_count:
+            count = min(frame_count - filled, self.length - position)
+            np.multiply(
+                self.audio_data[position : position + count].T,
+                volume,
+                out=output_data[:, filled : filled + count],
+            )
+            filled += count
+            position = 0
+
+        return output_data
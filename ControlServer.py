@@ -0,0 +1,50 @@
+import json
+import threading
+import socketserver
+
+
+class ControlRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # One command per line, one JSON response per line
+        for line in self.rfile:
+            command = line.decode("utf-8").strip()
+            if not command:
+                continue
+
+            try:
+                response = {"ok": True, "result": self.server.handle_command(command)}
+            except Exception as error:
+                response = {"ok": False, "error": str(error)}
+
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+
+class ControlTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ControlServer:
+    def __init__(self, handle_command, host="127.0.0.1", port=7700):
+        self.handle_command = handle_command
+        self.host = host
+        self.port = port
+
+        self.server = None
+        self.thread = None
+
+    # ----------------------------------------------------------------
+    def start(self):
+        # Bind to localhost only, the protocol has no authentication
+        self.server = ControlTCPServer((self.host, self.port), ControlRequestHandler)
+        self.server.handle_command = self.handle_command
+
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
@@ -0,0 +1,154 @@
+import numpy as np
+from math import gcd
+
+
+class ConvolutionReverb:
+    def __init__(
+        self, impulse_response, sample_rate=44100, block_size=256, max_duration=10.0
+    ):
+        self.sample_rate = sample_rate
+
+        # Mono impulse response at the engine rate, normalized to unit energy
+        # so the wet signal is about as loud as the dry one
+        impulse_response = np.asarray(impulse_response, dtype=np.float32)
+        if impulse_response.ndim > 1:
+            impulse_response = impulse_response.mean(axis=1)
+        impulse_response = impulse_response[: int(max_duration * sample_rate)]
+
+        energy = np.sqrt(np.sum(impulse_response.astype(np.float64) ** 2))
+        if energy > 0:
+            impulse_response = impulse_response / energy
+
+        self.impulse_response = impulse_response.astype(np.float32)
+        self.length = len(impulse_response)
+
+        self.block_size = None
+        self.reset(block_size)
+
+    def reset(self, block_size=None):
+        # Spectra are computed again only for a new block size
+        if block_size is not None and block_size != self.block_size:
+            self.block_size = block_size
+            self._prepare_spectra()
+
+        # last two blocks of input, overlap-save uses the second half
+        self.input_buffer = np.zeros(2 * self.block_size, dtype=np.float32)
+
+        # frequency-domain delay line stored twice, so the newest spectra
+        # are always one contiguous slice in the order of the partitions
+        self.spectra_buffer = np.zeros(
+            (2 * self.partition_count, self.block_size + 1), dtype=np.complex64
+        )
+        self.spectra_index = 0
+
+        self.product_buffer = np.zeros_like(self.partition_spectra)
+        self.output_spectrum = np.zeros(self.block_size + 1, dtype=np.complex64)
+
+        # samples of blocks that are not a multiple of the partition size,
+        # waiting for a whole partition, and mixed samples not returned yet
+        self.fifo = np.zeros(2 * self.block_size, dtype=np.float32)
+        self.fifo_count = 0
+        self.output_fifo = np.zeros(2 * self.block_size, dtype=np.float32)
+        self.output_count = 0
+
+    def _prepare_spectra(self):
+        # Uniform partitions of one block, zero-padded to two blocks
+        block_size = self.block_size
+        self.partition_count = max(1, -(-self.length // block_size))
+
+        impulse_response = np.zeros(self.partition_count * block_size, np.float32)
+        impulse_response[: self.length] = self.impulse_response
+
+        partitions = np.zeros((self.partition_count, 2 * block_size), np.float32)
+        partitions[:, :block_size] = impulse_response.reshape(-1, block_size)
+        self.partition_spectra = np.fft.rfft(partitions, axis=1).astype(np.complex64)
+
+    @property
+    def duration(self):
+        return self.length / self.sample_rate
+
+    # ----------------------------------------------------------------
+    def process(self, data, mix=0.5):
+        # Blocks are a multiple of the partition size, no latency is added
+        if not self.fifo_count and not self.output_count:
+            if len(data) % self.block_size == 0:
+                return self._process_blocks(data, mix)
+
+            # Other block sizes go through the FIFOs, padded with silence so
+            # the output never runs dry; the history and the tail are kept
+            self.output_count = self.block_size - gcd(len(data), self.block_size)
+            self.output_fifo[: self.output_count] = 0
+
+        return self._process_buffered(data, mix)
+
+    def _process_blocks(self, data, mix):
+        output_data = np.empty(len(data), dtype=np.float32)
+        for start in range(0, len(data), self.block_size):
+            block = data[start : start + self.block_size]
+            output_data[start : start + self.block_size] = self._process_block(block)
+
+        if mix < 1:
+            output_data *= mix
+            output_data += (1 - mix) * data
+        return output_data
+
+    def _process_buffered(self, data, mix):
+        frame_count = len(data)
+        self.fifo = self._append(self.fifo, self.fifo_count, data)
+        self.fifo_count += frame_count
+
+        # Whole partitions are processed with their own dry samples
+        count = self.fifo_count - self.fifo_count % self.block_size
+        if count:
+            self.output_fifo = self._append(
+                self.output_fifo,
+                self.output_count,
+                self._process_blocks(self.fifo[:count], mix),
+            )
+            self.output_count += count
+
+            self.fifo_count -= count
+            self.fifo[: self.fifo_count] = self.fifo[count : count + self.fifo_count]
+
+        # Finished samples, or silence on an irregular block
+        output_data = np.zeros(frame_count, dtype=np.float32)
+        count = min(frame_count, self.output_count)
+        output_data[frame_count - count :] = self.output_fifo[:count]
+
+        self.output_count -= count
+        self.output_fifo[: self.output_count] = self.output_fifo[
+            count : count + self.output_count
+        ]
+
+        return output_data
+
+    def _append(self, buffer, count, data):
+        # Buffers grow only for blocks larger than expected
+        if count + len(data) > len(buffer):
+            new_buffer = np.zeros(2 * (count + len(data)), dtype=np.float32)
+            new_buffer[:count] = buffer[:count]
+            buffer = new_buffer
+
+        buffer[count : count + len(data)] = data
+        return buffer
+
+    def _process_block(self, data):
+        block_size = self.block_size
+        self.input_buffer[:block_size] = self.input_buffer[block_size:]
+        self.input_buffer[block_size:] = data
+
+        # The newest spectrum goes in front of the older ones
+        partition_count = self.partition_count
+        index = (self.spectra_index - 1) % partition_count
+        spectrum = np.fft.rfft(self.input_buffer)
+        self.spectra_buffer[index] = spectrum
+        self.spectra_buffer[index + partition_count] = spectrum
+        self.spectra_index = index
+
+        # One multiply-accumulate over all partitions, without allocations
+        spectra = self.spectra_buffer[index : index + partition_count]
+        np.multiply(self.partition_spectra, spectra, out=self.product_buffer)
+        self.product_buffer.sum(axis=0, out=self.output_spectrum)
+
+        # Overlap-save, the first half is wrapped around and dropped
+        return np.fft.irfft(self.output_spectrum, 2 * block_size)[block_size:]
@@ -0,0 +1,153 @@
+import pyaudio
+import threading
+
+
+class DeviceManager:
+    def __init__(self):
+        # one PortAudio instance for the whole process
+        self.pyaudio = pyaudio.PyAudio()
+        self.lock = threading.Lock()
+
+        self.devices = None
+
+        # stopped streams kept open for a fast restart
+        self.idle_streams = {}
+        self.stream_keys = {}
+
+    # ----------------------------------------------------------------
+    def get_devices(self):
+        with self.lock:
+            if self.devices is None:
+                self.devices = self._enumerate_devices()
+            return self.devices
+
+    def get_input_devices(self):
+        return [info for info in self.get_devices() if info["maxInputChannels"] > 0]
+
+    def get_output_devices(self):
+        return [info for info in self.get_devices() if info["maxOutputChannels"] > 0]
+
+    def refresh_devices(self):
+        # PortAudio only rescans devices on initialization
+        with self.lock:
+            self._close_idle_streams()
+            if not self.stream_keys:
+                self.pyaudio.terminate()
+                self.pyaudio = pyaudio.PyAudio()
+            self.devices = None
+
+        return self.get_devices()
+
+    def _enumerate_devices(self):
+        host_api_names = {}
+        for i in range(self.pyaudio.get_host_api_count()):
+            host_api_names[i] = self.pyaudio.get_host_api_info_by_index(i)["name"]
+
+        devices = []
+        for i in range(self.pyaudio.get_device_count()):
+            info = dict(self.pyaudio.get_device_info_by_index(i))
+            info["hostApiName"] = host_api_names.get(info["hostApi"], "")
+            info["id"] = f"{info['hostApiName']}: {info['name']}"
+            devices.append(info)
+
+        return devices
+
+    # ----------------------------------------------------------------
+    def get_default_input_device_id(self):
+        try:
+            index = self.pyaudio.get_default_input_device_info()["index"]
+        except IOError:
+            return ""
+        return self.get_devices()[index]["id"]
+
+    def get_default_output_device_id(self):
+        try:
+            index = self.pyaudio.get_default_output_device_info()["index"]
+        except IOError:
+            return ""
+        return self.get_devices()[index]["id"]
+
+    def find_output_device_id(self, name, default=""):
+        for info in self.get_output_devices():
+            if name.lower() in info["name"].lower():
+                return info["id"]
+        return default
+
+    def resolve_input_device(self, device):
+        return self._resolve_device(device, self.get_input_devices())
+
+    def resolve_output_device(self, device):
+        return self._resolve_device(device, self.get_output_devices())
+
+    def _resolve_device(self, device, devices):
+        # Accept a device index, a stable "host api: name" ID or a name
+        device = str(device).strip()
+
+        if device.isdigit():
+            for info in devices:
+                if info["index"] == int(device):
+                    return info["index"]
+
+        for key in ["id", "name"]:
+            for info in devices:
+                if info[key] == device:
+                    return info["index"]
+
+        for info in devices:
+            if device.lower() in info["name"].lower():
+                return info["index"]
+
+        raise ValueError(f"Unknown audio device: {device}")
+
+    # ----------------------------------------------------------------
+    def open_stream(self, **kwargs):
+        key = tuple(sorted(kwargs.items()))
+
+        with self.lock:
+            stream = self.idle_streams.pop(key, None)
+
+        if stream is not None:
+            stream.start_stream()
+        else:
+            stream = self.pyaudio.open(**kwargs)
+
+        with self.lock:
+            self.stream_keys[stream] = key
+
+        return stream
+
+    def release_stream(self, stream):
+        stream.stop_stream()
+
+        with self.lock:
+            key = self.stream_keys.pop(stream)
+
+            # Keep the latest stream with these parameters for a restart
+            previous_stream = self.idle_streams.pop(key, None)
+            self.idle_streams[key] = stream
+
+        if previous_stream is not None:
+            previous_stream.close()
+
+    def _close_idle_streams(self):
+        for stream in self.idle_streams.values():
+            stream.close()
+        self.idle_streams = {}
+
+    def terminate(self):
+        with self.lock:
+            self._close_idle_streams()
+            for stream in list(self.stream_keys):
+                stream.close()
+            self.stream_keys = {}
+            self.pyaudio.terminate()
+
+
+device_manager = None
+
+
+def get_device_manager():
+    global device_manager
+    if device_manager is None:
+        device_manager = DeviceManager()
+    return device_manager
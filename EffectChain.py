@@ -0,0 +1,196 @@
+import os
+import json
+
+# presets shipped with the program, see load_preset()
+PRESET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "presets")
+
+# stages implemented by the device in Python, any other type is the name of
+# a pedalboard plugin class
+BUILTIN_EFFECTS = ["denoiser", "noise_gate", "convolution"]
+
+# the chain used before presets, the reverb follows the reverberation switch
+DEFAULT_PRESET = {
+    "name": "default",
+    "effects": [
+        {"type": "denoiser"},
+        {"type": "noise_gate"},
+        {"type": "convolution"},
+        {
+            "type": "Reverb",
+            "enabled_by": "reverb_enabled",
+            "bind": {"room_size": "reverb_room_size"},
+        },
+    ],
+}
+
+
+def get_preset_names():
+    names = ["default"]
+    if os.path.isdir(PRESET_DIR):
+        for file_name in sorted(os.listdir(PRESET_DIR)):
+            if file_name.endswith(".json"):
+                names.append(os.path.splitext(file_name)[0])
+    return names
+
+
+def load_preset(name):
+    # A preset name from the presets directory or a JSON file
+    if name == "default":
+        return DEFAULT_PRESET
+
+    file_path = name
+    if not os.path.isfile(file_path):
+        file_path = os.path.join(PRESET_DIR, f"{name}.json")
+
+    try:
+        with open(file_path, "r") as file:
+            return json.load(file)
+    except OSError:
+        raise ValueError(f"Unknown effect preset: {name}")
+
+
+class EffectChain:
+    def __init__(self, preset, sample_rate=44100):
+        self.name = preset.get("name", "custom")
+        self.sample_rate = sample_rate
+
+        # (type, enabled_by, bindings, settings) of every effect: an optional
+        # boolean parameter that switches the effect, plugin attributes that
+        # follow parameters, and constant plugin attributes
+        self.effects = []
+        for effect in preset.get("effects", []):
+            effect = dict(effect)
+            effect_type = effect.pop("type", None)
+            if not isinstance(effect_type, str):
+                raise ValueError("Every effect needs a type")
+
+            enabled_by = effect.pop("enabled_by", None)
+            bindings = effect.pop("bind", {})
+            self.effects.append((effect_type, enabled_by, bindings, effect))
+
+        # pedalboard plugins of every input by effect index, kept for the
+        # life of the chain so their state and parameters survive recompiles
+        self.plugins = []
+
+        # segments compiled by prepare() for each set of enabled effects,
+        # replaced as a whole; the segments in use and the last values of
+        # the bound parameters
+        self.compiled_segments = {}
+        self.segments = []
+        self.bound_values = {}
+
+    # ----------------------------------------------------------------
+    def prepare(self, parameters, input_count):
+        # Called outside the audio thread, creates the plugins of the enabled
+        # effects and compiles their segments, so the audio thread never
+        # allocates when an effect is switched
+        while len(self.plugins) < input_count:
+            self.plugins.append({})
+
+        for index, (effect_type, enabled_by, bindings, settings) in enumerate(
+            self.effects
+        ):
+            if effect_type in BUILTIN_EFFECTS:
+                continue
+            if enabled_by is not None and not parameters.get(enabled_by):
+                continue
+
+            for plugins in self.plugins:
+                if index not in plugins:
+                    plugins[index] = self._create_plugin(
+                        effect_type, bindings, settings, parameters
+                    )
+
+        # Lists compiled before are compiled again for the new plugins
+        enabled_flags = self._get_enabled_flags(parameters)
+        compiled_segments = {
+            flags: self._compile(flags)
+            for flags in set(self.compiled_segments) | {enabled_flags}
+        }
+
+        # Plugins created after the bound values were applied get them again
+        self.bound_values = {}
+        self.compiled_segments = compiled_segments
+
+    def _create_plugin(self, effect_type, bindings, settings, parameters):
+        # pedalboard is slow to import, load it only when an effect is used
+        import pedalboard
+
+        plugin_class = getattr(pedalboard, effect_type, None)
+        if not isinstance(plugin_class, type) or not issubclass(
+            plugin_class, pedalboard.Plugin
+        ):
+            raise ValueError(f"Unknown effect: {effect_type}")
+
+        settings = dict(settings)
+        for attribute, name in bindings.items():
+            settings[attribute] = parameters[name]
+
+        try:
+            return plugin_class(**settings)
+        except TypeError as error:
+            raise ValueError(f"Wrong {effect_type} settings: {error}")
+
+    # ----------------------------------------------------------------
+    def get_segments(self, parameters, values=None):
+        # Called by the audio thread: (stage, None) for the built-in stages
+        # and ("voice_effects", boards) with one Pedalboard per input for
+        # every run of plugins; a switch prepare() has not seen yet keeps
+        # the segments in use
+        segments = self.compiled_segments.get(self._get_enabled_flags(parameters))
+        if segments is not None:
+            self.segments = segments
+
+        self._update_parameters(parameters, values or {})
+        return self.segments
+
+    def _get_enabled_flags(self, parameters):
+        return tuple(
+            enabled_by is None or bool(parameters.get(enabled_by))
+            for _, enabled_by, _, _ in self.effects
+        )
+
+    def _compile(self, enabled_flags):
+        segments = []
+        plugin_indices = []
+
+        for index, (effect_type, _, _, _) in enumerate(self.effects):
+            if not enabled_flags[index]:
+                continue
+
+            if effect_type in BUILTIN_EFFECTS:
+                self._add_boards(segments, plugin_indices)
+                plugin_indices = []
+                segments.append((effect_type, None))
+            else:
+                plugin_indices.append(index)
+
+        self._add_boards(segments, plugin_indices)
+        return segments
+
+    def _add_boards(self, segments, plugin_indices):
+        if not plugin_indices:
+            return
+
+        from pedalboard import Pedalboard
+
+        # Plugins that are not prepared yet are skipped
+        boards = [
+            Pedalboard([plugins[i] for i in plugin_indices if i in plugins])
+            for plugins in self.plugins
+        ]
+        segments.append(("voice_effects", boards))
+
+    def _update_parameters(self, parameters, values):
+        # Bound plugin attributes are set in place, only when they change
+        for index, (_, _, bindings, _) in enumerate(self.effects):
+            for attribute, name in bindings.items():
+                value = values.get(name, parameters.get(name))
+                if self.bound_values.get((index, attribute)) == value:
+                    continue
+
+                self.bound_values[(index, attribute)] = value
+                for plugins in self.plugins:
+                    plugin = plugins.get(index)
+                    if plugin is not None:
+                        setattr(plugin, attribute, value)
@@ -0,0 +1,57 @@
+import numpy as np
+
+
+class Float32Converter:
+    # Devices with native float32 support only need interleaving
+
+    sample_format = "float32"
+
+    def __init__(self, block_size=256, channels=1):
+        self.channels = channels
+        self.frame_size = 4 * channels
+        self.block_size = 0
+        self._allocate_buffers(block_size)
+
+    def _allocate_buffers(self, block_size):
+        self.block_size = block_size
+
+        # buffers are reused for every chunk of the same size
+        self.decode_buffer = np.zeros((self.channels, block_size), dtype=np.float32)
+        self.clip_buffer = np.zeros((self.channels, block_size), dtype=np.float32)
+        self.encode_buffer = np.zeros((block_size, self.channels), dtype=np.float32)
+
+    # ----------------------------------------------------------------
+    def decode(self, data):
+        samples = np.frombuffer(data, dtype=np.float32)
+
+        # Mono data is a read-only view of the PyAudio bytes, no copy at all
+        if self.channels == 1:
+            return samples
+
+        samples = samples.reshape(-1, self.channels)
+        if len(samples) > self.block_size:
+            self._allocate_buffers(len(samples))
+
+        decoded_data = self.decode_buffer[:, : len(samples)]
+        np.copyto(decoded_data, samples.T)
+
+        return decoded_data
+
+    def encode(self, data):
+        data = data.reshape(-1, data.shape[-1])
+        frame_count = data.shape[-1]
+
+        if frame_count > self.block_size:
+            self._allocate_buffers(frame_count)
+
+        # Saturate at full scale, like an int16 device would
+        clipped_data = self.clip_buffer[:, :frame_count]
+        np.clip(data, -1, 1, out=clipped_data)
+
+        if self.channels == 1:
+            return clipped_data.tobytes()
+
+        encoded_data = self.encode_buffer[:frame_count]
+        np.copyto(encoded_data, clipped_data.T)
+
+        return encoded_data.tobytes()
@@ -0,0 +1,147 @@
+import threading
+import numpy as np
+from Float32Converter import Float32Converter
+from SpectralDenoiser import SpectralDenoiser
+
+
+class InputStage:
+    def __init__(
+        self, name, device_index, sample_rate=None, block_size=256, engine_rate=44100
+    ):
+        self.name = name
+        self.device_index = device_index
+
+        # native device rate, None for the engine rate
+        self.sample_rate = sample_rate
+
+        # input conversion and resampling, see VirtualMicroDevice._prepare_streams()
+        self.converter = Float32Converter(block_size)
+        self.resampler = None
+
+        # per-input voice effects, pedalboard plugins are in the effect chain
+        self.denoiser = SpectralDenoiser(engine_rate, block_size)
+        self.denoiser_active = False
+        self.convolution_reverb = None
+        self.convolution_active = False
+
+        # decoded samples waiting for the next engine block, filled by the
+        # first input or by the stream of another device with its own clock
+        self.fifo = np.zeros(0, dtype=np.float32)
+        self.fifo_count = 0
+        self.capacity = 0
+        self.lock = threading.Lock()
+
+        self.stream = None
+        self.latency = 0
+        self.thread = None
+        self.is_running = False
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.overflow_count = 0
+        self.underflow_count = 0
+
+    # ----------------------------------------------------------------
+    def set_converter(self, converter):
+        self.converter = converter
+
+    def set_resampler(self, resampler):
+        self.resampler = resampler
+
+    def reset(self, block_size, capacity, prefill=0):
+        # Called before the streams start, capacity and prefill in frames
+        with self.lock:
+            self.capacity = max(block_size, capacity)
+            self.fifo = np.zeros(self.capacity + 2 * block_size, dtype=np.float32)
+            self.fifo_count = min(prefill, self.capacity)
+
+        self.denoiser.reset(block_size)
+        self.denoiser_active = False
+
+        if self.convolution_reverb is not None:
+            self.convolution_reverb.reset()
+        self.convolution_active = False
+
+    def push(self, data):
+        samples = self.converter.decode(data)
+        if self.resampler is not None:
+            samples = self.resampler.process(samples)
+
+        with self.lock:
+            count = self.fifo_count + len(samples)
+            if count > len(self.fifo):
+                fifo = np.zeros(2 * count, dtype=np.float32)
+                fifo[: self.fifo_count] = self.fifo[: self.fifo_count]
+                self.fifo = fifo
+
+            self.fifo[self.fifo_count : count] = samples
+            self.fifo_count = count
+
+            if self.fifo_count > self.capacity:
+                # The engine fell behind this device, the oldest samples go
+                self.overflow_count += 1
+                self._discard(self.fifo_count - self.capacity)
+
+    def pop(self, frame_count):
+        block = np.zeros(frame_count, dtype=np.float32)
+
+        with self.lock:
+            count = min(frame_count, self.fifo_count)
+            if count < frame_count:
+                # This device is late, the rest is silence
+                self.underflow_count += 1
+
+            block[:count] = self.fifo[:count]
+            self._discard(count)
+
+        return block
+
+    def get_available_count(self):
+        return self.fifo_count
+
+    def _discard(self, count):
+        self.fifo_count -= count
+        self.fifo[: self.fifo_count] = self.fifo[count : count + self.fifo_count]
+
+    # ----------------------------------------------------------------
+    def stream_callback(self, in_data, frame_count, time_info, status):
+        self.push(in_data)
+        return None
+
+    def start(self, stream, frame_count):
+        # Blocking mode, the stream is read from its own thread
+        self.stream = stream
+        self.is_running = True
+
+        self.thread = threading.Thread(
+            target=self._run, args=(frame_count,), daemon=True
+        )
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        self.is_running = False
+
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self, frame_count):
+        while self.is_running:
+            try:
+                data = self.stream.read(frame_count, exception_on_overflow=False)
+            except OSError:
+                # The stream was closed while reading
+                break
+
+            self.push(data)
+
+    # ----------------------------------------------------------------
+    def get_stats(self):
+        return {
+            "input": self.name,
+            "buffered": self.fifo_count,
+            "capacity": self.capacity,
+            "overflows": self.overflow_count,
+            "underflows": self.underflow_count,
+        }
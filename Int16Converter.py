@@ -0,0 +1,61 @@
+import numpy as np
+
+INT16_MIN = -32768
+INT16_MAX = 32767
+INT16_SCALE = 32768
+
+
+class Int16Converter:
+    # Converts interleaved int16 device data to planar float32 in the
+    # [-1, 1] full scale and back, for devices without float32 support
+
+    sample_format = "int16"
+
+    def __init__(self, block_size=256, channels=1):
+        self.channels = channels
+        self.frame_size = 2 * channels
+        self.block_size = 0
+        self._allocate_buffers(block_size)
+
+    def _allocate_buffers(self, block_size):
+        self.block_size = block_size
+
+        # buffers are reused for every chunk of the same size
+        self.decode_buffer = np.zeros((self.channels, block_size), dtype=np.float32)
+        self.clip_buffer = np.zeros((self.channels, block_size), dtype=np.float32)
+        self.encode_buffer = np.zeros((block_size, self.channels), dtype=np.int16)
+
+    # ----------------------------------------------------------------
+    def decode(self, data):
+        # View the PyAudio bytes as int16 frames without copying
+        samples = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels)
+
+        if len(samples) > self.block_size:
+            self._allocate_buffers(len(samples))
+
+        decoded_data = self.decode_buffer[:, : len(samples)]
+        np.copyto(decoded_data, samples.T)
+        decoded_data *= 1 / INT16_SCALE
+
+        # Mono data is returned as a plain 1D block
+        if self.channels == 1:
+            return decoded_data[0]
+        return decoded_data
+
+    def encode(self, data):
+        data = data.reshape(-1, data.shape[-1])
+        frame_count = data.shape[-1]
+
+        if frame_count > self.block_size:
+            self._allocate_buffers(frame_count)
+
+        # Saturate instead of wrapping around on int16 overflow
+        clipped_data = self.clip_buffer[:, :frame_count]
+        np.multiply(data, INT16_SCALE, out=clipped_data)
+        np.clip(clipped_data, INT16_MIN, INT16_MAX, out=clipped_data)
+
+        encoded_data = self.encode_buffer[:frame_count]
+        np.copyto(encoded_data, clipped_data.T, casting="unsafe")
+
+        # PyAudio only accepts immutable bytes, this is a single memcpy
+        return encoded_data.tobytes()
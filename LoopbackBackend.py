@@ -0,0 +1,298 @@
+import time
+import threading
+import numpy as np
+from collections import deque
+from AudioBackend import AudioBackend
+
+
+class LoopbackStream:
+    def __init__(
+        self,
+        rate,
+        frames_per_buffer,
+        sample_format,
+        channels,
+        is_input,
+        is_output,
+        device_index,
+        stream_callback,
+        latency_blocks,
+        buffer_blocks,
+    ):
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self.sample_format = sample_format
+        self.channels = channels
+        self.frame_size = (4 if sample_format == "float32" else 2) * channels
+        self.is_input = is_input
+        self.is_output = is_output
+        self.device_index = device_index
+        self.stream_callback = stream_callback
+        self.buffer_blocks = buffer_blocks
+
+        # simulated converter/driver latency, a delay line of silent blocks
+        self.latency_blocks = latency_blocks
+        silence = bytes(frames_per_buffer * self.frame_size)
+        self.delay_line = deque([silence] * latency_blocks)
+
+        # blocks exchanged with the blocking read() API, and written frames
+        # of any length for write()
+        self.blocks = deque()
+        self.output_data = bytearray()
+        self.buffer_size = buffer_blocks * frames_per_buffer * self.frame_size
+        self.condition = threading.Condition()
+        self.is_active = True
+
+        # statistics
+        self.read_count = 0
+        self.write_count = 0
+        self.overflow_count = 0
+        self.underflow_count = 0
+
+    # ----------------------------------------------------------------
+    def read(self, num_frames, exception_on_overflow=False):
+        with self.condition:
+            while not self.blocks and self.is_active:
+                self.condition.wait()
+
+            if not self.blocks:
+                return bytes(num_frames * self.frame_size)
+
+            self.read_count += 1
+            self.condition.notify_all()
+            return self.blocks.popleft()
+
+    def write(self, frames, num_frames=None, exception_on_underflow=False):
+        with self.condition:
+            # Blocking write waits while the device buffer is full
+            while len(self.output_data) >= self.buffer_size and self.is_active:
+                self.condition.wait()
+
+            self.output_data += frames
+            self.write_count += 1
+            self.condition.notify_all()
+
+    def start_stream(self):
+        with self.condition:
+            self.is_active = True
+
+    def stop_stream(self):
+        with self.condition:
+            self.is_active = False
+            self.condition.notify_all()
+
+    def close(self):
+        self.stop_stream()
+
+    def get_input_latency(self):
+        return self.latency_blocks * self.frames_per_buffer / self.rate
+
+    def get_output_latency(self):
+        return self.latency_blocks * self.frames_per_buffer / self.rate
+
+    # ----------------------------------------------------------------
+    def encode(self, samples):
+        # int16 mono test signal -> stream format
+        samples = np.repeat(samples[:, np.newaxis], self.channels, axis=1)
+        if self.sample_format == "float32":
+            return (samples / 32768).astype(np.float32).tobytes()
+        return samples.tobytes()
+
+    def decode(self, data):
+        # stream format -> int16 samples of the first channel
+        if self.sample_format == "float32":
+            samples = np.frombuffer(data, dtype=np.float32) * 32768
+            samples = np.clip(samples, -32768, 32767).astype(np.int16)
+        else:
+            samples = np.frombuffer(data, dtype=np.int16)
+        return samples[:: self.channels]
+
+    def capture(self, samples):
+        # Called by the simulated clock with one block from the "microphone"
+        self.delay_line.append(self.encode(samples))
+        data = self.delay_line.popleft()
+
+        if self.stream_callback is not None:
+            self.stream_callback(data, self.frames_per_buffer, {}, 0)
+            return
+
+        with self.condition:
+            if len(self.blocks) >= self.buffer_blocks:
+                # The device didn't read in time, the oldest block is lost
+                self.blocks.popleft()
+                self.overflow_count += 1
+
+            self.blocks.append(data)
+            self.condition.notify_all()
+
+    def play(self):
+        # Called by the simulated clock, returns the block that is "heard"
+        if self.stream_callback is not None:
+            data = self.stream_callback(None, self.frames_per_buffer, {}, 0)
+        else:
+            size = self.frames_per_buffer * self.frame_size
+
+            with self.condition:
+                if len(self.output_data) < size:
+                    # Underflow, the missing part is silence
+                    self.underflow_count += 1
+
+                data = bytes(self.output_data[:size]).ljust(size, b"\0")
+                del self.output_data[:size]
+                self.condition.notify_all()
+
+        self.delay_line.append(data)
+        return self.delay_line.popleft()
+
+
+class LoopbackBackend(AudioBackend):
+    def __init__(
+        self,
+        input_data,
+        sample_rate=44100,
+        latency_blocks=1,
+        supported_formats=("int16", "float32"),
+    ):
+        # mono int16 signal the input devices capture, silence after its end
+        self.input_data = np.asarray(input_data, dtype=np.int16)
+        self.sample_rate = sample_rate
+        self.latency_blocks = latency_blocks
+
+        # formats the simulated devices accept, to test int16 fallbacks
+        self.supported_formats = supported_formats
+
+        # simulated clock in frames
+        self.clock = 0
+
+        self.streams = []
+        self.recorded_blocks = {}
+        self.dropped_block_count = 0
+        self.condition = threading.Condition()
+
+    # ----------------------------------------------------------------
+    def open_stream(
+        self,
+        rate,
+        channels=1,
+        sample_format="int16",
+        input=False,
+        output=False,
+        input_device_index=None,
+        output_device_index=None,
+        frames_per_buffer=256,
+        stream_callback=None,
+    ):
+        if sample_format not in self.supported_formats:
+            raise ValueError(f"Unsupported sample format: {sample_format}")
+
+        stream = LoopbackStream(
+            rate,
+            frames_per_buffer,
+            sample_format,
+            channels,
+            input,
+            output,
+            input_device_index if input else output_device_index,
+            stream_callback,
+            self.latency_blocks,
+            buffer_blocks=2,
+        )
+
+        with self.condition:
+            self.streams.append(stream)
+            self.condition.notify_all()
+
+        return stream
+
+    def release_stream(self, stream):
+        stream.stop_stream()
+
+        with self.condition:
+            self.streams.remove(stream)
+            self.dropped_block_count += stream.overflow_count + stream.underflow_count
+
+    def is_format_supported(
+        self,
+        sample_format,
+        rate,
+        channels=1,
+        input=False,
+        output=False,
+        input_device_index=None,
+        output_device_index=None,
+    ):
+        return sample_format in self.supported_formats
+
+    def wait_for_streams(self, count, timeout=5.0):
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self.streams) >= count, timeout)
+
+    def finish(self):
+        # Wake up a device blocked in read() or write()
+        for stream in list(self.streams):
+            stream.stop_stream()
+
+    # ----------------------------------------------------------------
+    def tick(self, device_timeout=None):
+        input_streams = [stream for stream in self.streams if stream.is_input]
+        output_streams = [stream for stream in self.streams if stream.is_output]
+        frame_count = input_streams[0].frames_per_buffer
+
+        data = self.input_data[self.clock : self.clock + frame_count]
+        data = np.pad(data, (0, frame_count - len(data)))
+
+        for stream in input_streams:
+            stream.capture(data)
+
+        # Let a blocking-mode device process the block, like an ideal CPU
+        if device_timeout is not None:
+            for stream in input_streams:
+                if stream.stream_callback is None:
+                    self._wait_for_device(stream, output_streams, device_timeout)
+
+        for stream in output_streams:
+            block = stream.decode(stream.play())
+            self.recorded_blocks.setdefault(stream.device_index, []).append(block)
+
+        self.clock += frame_count
+
+    def _wait_for_device(self, input_stream, output_streams, timeout):
+        deadline = time.perf_counter() + timeout
+
+        with input_stream.condition:
+            while input_stream.blocks and time.perf_counter() < deadline:
+                input_stream.condition.wait(0.001)
+
+        for stream in output_streams:
+            # Wait until the next played block is complete, resampled output
+            # comes in engine blocks that don't match the device buffer
+            size = stream.frames_per_buffer * stream.frame_size
+
+            with stream.condition:
+                while len(stream.output_data) < size and time.perf_counter() < deadline:
+                    stream.condition.wait(0.001)
+
+    def run(self, block_count, realtime=False):
+        # Simulated time runs as fast as possible, or paced like a sound card
+        block_time = self.streams[0].frames_per_buffer / self.sample_rate
+        start_time = time.perf_counter()
+
+        for i in range(block_count):
+            self.tick(device_timeout=None if realtime else 1.0)
+
+            if realtime:
+                delay = start_time + (i + 1) * block_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+    # ----------------------------------------------------------------
+    def get_output(self, device_index):
+        blocks = self.recorded_blocks.get(device_index, [])
+        if not blocks:
+            return np.zeros(0, dtype=np.int16)
+        return np.concatenate(blocks)
+
+    def get_dropped_block_count(self):
+        return self.dropped_block_count + sum(
+            stream.overflow_count + stream.underflow_count for stream in self.streams
+        )
@@ -0,0 +1,145 @@
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from VirtualMicroDevice import VirtualMicroDevice
+from settings import DEFAULT_CONFIG, apply_settings, load_effects
+
+AUDIO_FILE_EXTENSIONS = (".wav", ".flac", ".ogg", ".mp3", ".aiff", ".aif")
+
+
+class OfflineRenderer:
+    def __init__(self, config=None):
+        self.config = dict(DEFAULT_CONFIG)
+        self.config.update(config or {})
+
+    # ----------------------------------------------------------------
+    def create_device(self):
+        # The same device and settings as the live path, without streams
+        device = VirtualMicroDevice(
+            input_device_index=None,
+            output_device_index=None,
+            second_output_device_index=None,
+            sample_rate=self.config["sample_rate"],
+            block_size=self.config["block_size"],
+            channels=self.config["channels"],
+        )
+
+        # The background reverb is processed block by block, like live
+        # before its render is ready, so renders do not depend on timing
+        device.set_reverb_cache_memory_budget(0)
+
+        # Devices without streams, so the routing matrix has the same shape;
+        # only the first input is rendered
+        for _ in self.config["extra_inputs"]:
+            device.add_input_device(None)
+        for _ in self.config["extra_outputs"]:
+            device.add_output_device(None)
+
+        for i, file_path in enumerate(self.config["background_audio"]):
+            if i == 0:
+                device.load_background_audio(file_path, streaming=False)
+            else:
+                device.add_background_audio(file_path, streaming=False)
+
+        load_effects(device, self.config)
+        apply_settings(device, self.config)
+
+        return device
+
+    def render_file(self, input_path, output_path):
+        import soxr
+        import soundfile as sf
+
+        device = self.create_device()
+        sample_rate = device.sample_rate
+        block_size = device.block_size
+        channels = device.channels
+
+        start_time = time.perf_counter()
+        frame_count = 0
+        written_count = 0
+
+        with sf.SoundFile(input_path) as input_file, sf.SoundFile(
+            output_path,
+            "w",
+            samplerate=sample_rate,
+            channels=channels,
+            subtype="PCM_16",
+        ) as output_file:
+            resampler = soxr.ResampleStream(
+                input_file.samplerate, sample_rate, 1, dtype="float32"
+            )
+            pending_data = np.zeros(0, dtype=np.float32)
+
+            while True:
+                decoded_data = input_file.read(65536, dtype="float32", always_2d=True)
+                last = len(decoded_data) < 65536
+
+                # The voice is mono float32, like the native input stream
+                input_data = resampler.resample_chunk(
+                    decoded_data.mean(axis=1), last=last
+                )
+                frame_count += len(input_data)
+
+                pending_data = np.concatenate([pending_data, input_data])
+
+                # The live path only sees full blocks, pad the tail
+                if last:
+                    padding = np.zeros(-len(pending_data) % block_size, np.float32)
+                    pending_data = np.concatenate([pending_data, padding])
+
+                block_count = len(pending_data) // block_size
+                for i in range(block_count):
+                    block = pending_data[i * block_size : (i + 1) * block_size]
+                    processed_data = device.process_block(block.tobytes(), block_size)
+                    if not processed_data:
+                        raise RuntimeError(f"Failed to process {input_path}")
+
+                    output_data = np.frombuffer(processed_data[0], dtype=np.float32)
+                    output_data = output_data.reshape(-1, channels)
+                    output_data = output_data[: frame_count - written_count]
+                    output_file.write(output_data)
+                    written_count += len(output_data)
+
+                pending_data = pending_data[block_count * block_size :]
+
+                if last:
+                    break
+
+        elapsed_time = time.perf_counter() - start_time
+        duration = frame_count / sample_rate
+
+        return {
+            "input": input_path,
+            "output": output_path,
+            "duration": duration,
+            "render_time": elapsed_time,
+            "realtime_factor": duration / elapsed_time if elapsed_time else 0,
+        }
+
+    def render_directory(self, input_dir, output_dir, workers=None):
+        os.makedirs(output_dir, exist_ok=True)
+
+        jobs = []
+        for file_name in sorted(os.listdir(input_dir)):
+            if file_name.lower().endswith(AUDIO_FILE_EXTENSIONS):
+                output_name = os.path.splitext(file_name)[0] + ".wav"
+                jobs.append(
+                    (
+                        os.path.join(input_dir, file_name),
+                        os.path.join(output_dir, output_name),
+                    )
+                )
+
+        # Every worker process builds its own device from the config
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(render_file, self.config, input_path, output_path)
+                for input_path, output_path in jobs
+            ]
+            return [future.result() for future in futures]
+
+
+def render_file(config, input_path, output_path):
+    return OfflineRenderer(config).render_file(input_path, output_path)
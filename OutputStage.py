@@ -0,0 +1,58 @@
+from Float32Converter import Float32Converter
+from OutputWriter import OutputWriter
+
+
+class OutputStage:
+    def __init__(
+        self,
+        name,
+        device_index,
+        sample_rate=None,
+        block_size=256,
+        channels=1,
+        engine_rate=44100,
+        telemetry=None,
+    ):
+        self.name = name
+        self.device_index = device_index
+        self.enabled = True
+
+        # native device rate, None for the engine rate
+        self.sample_rate = sample_rate
+
+        # per-output conversion, replaced when the device only supports int16
+        self.channels = channels
+        self.converter = Float32Converter(block_size, channels)
+
+        # streaming resampler for devices at another rate than the engine
+        self.resampler = None
+
+        # bounded buffer between processing and the device
+        self.writer = OutputWriter(name, block_size, engine_rate, telemetry)
+
+        # copies the mixed blocks to disk, see VirtualMicroDevice.start_recording()
+        self.recording_tap = None
+
+        self.stream = None
+        self.stream_callback = None
+        self.latency = 0
+
+    # ----------------------------------------------------------------
+    def set_converter(self, converter):
+        self.converter = converter
+
+    def set_resampler(self, resampler):
+        self.resampler = resampler
+
+    # ----------------------------------------------------------------
+    def process(self, mixed_data):
+        # The routing matrix already mixed this output, (channels, frames)
+        recording_tap = self.recording_tap
+        if recording_tap is not None:
+            recording_tap.push(mixed_data)
+
+        if self.resampler is not None:
+            mixed_data = self.resampler.process(mixed_data)
+
+        # Convert to the device format
+        return self.converter.encode(mixed_data)
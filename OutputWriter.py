@@ -0,0 +1,137 @@
+import time
+import threading
+from collections import deque
+
+
+class OutputWriter:
+    def __init__(self, name, block_size=256, sample_rate=44100, telemetry=None):
+        self.name = name
+        self.block_size = block_size
+        self.frame_size = 2
+        self.sample_rate = sample_rate
+        self.telemetry = telemetry
+
+        # bounded ring of (enqueue time, data); deque append and popleft
+        # are atomic, so the producer never waits for the writer
+        self.capacity = 1
+        self.blocks = deque(maxlen=self.capacity)
+        self.block_ready = threading.Event()
+
+        # part of a block left over after the last pop()
+        self.pending_data = b""
+
+        self.stream = None
+        self.thread = None
+        self.is_running = False
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.written_count = 0
+        self.dropped_count = 0
+        self.late_count = 0
+        self.underflow_count = 0
+
+    # ----------------------------------------------------------------
+    def reset(self, block_size, sample_rate, frame_size, capacity, prefill=0):
+        # Called before the streams start, prefill absorbs clock jitter
+        self.block_size = block_size
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.pending_data = b""
+        silence = bytes(block_size * frame_size)
+
+        self.capacity = max(1, capacity)
+        self.blocks = deque(maxlen=self.capacity)
+        for _ in range(min(prefill, self.capacity)):
+            self.blocks.append((time.perf_counter(), silence))
+
+    def push(self, data):
+        if len(self.blocks) == self.capacity:
+            # The output is stalled, its oldest block is dropped
+            self.dropped_count += 1
+
+        self.blocks.append((time.perf_counter(), data))
+        self.block_ready.set()
+
+    def pop(self, frame_count):
+        size = frame_count * self.frame_size
+        data = self.pending_data
+
+        # Resampled blocks don't match the device buffer, they are joined
+        while len(data) < size:
+            try:
+                enqueue_time, block = self.blocks.popleft()
+            except IndexError:
+                # Buffer underflow, the rest is silence
+                self.underflow_count += 1
+                data = data.ljust(size, b"\0")
+                break
+
+            self._check_late(enqueue_time)
+            self.written_count += 1
+            data = data + block if data else block
+
+        self.pending_data = data[size:]
+        return data[:size]
+
+    def count_underflow(self):
+        self.underflow_count += 1
+
+    def _check_late(self, enqueue_time):
+        # A block that waited longer than the whole buffer is late
+        max_delay = self.capacity * self.block_size / self.sample_rate
+        if time.perf_counter() - enqueue_time > max_delay:
+            self.late_count += 1
+
+    # ----------------------------------------------------------------
+    def start(self, stream):
+        # Blocking mode, the stream is written from its own thread
+        self.stream = stream
+        self.is_running = True
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        self.is_running = False
+        self.block_ready.set()
+
+        if self.thread is not None:
+            # A stalled device may keep write() blocked until it is released
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self):
+        while self.is_running:
+            try:
+                enqueue_time, data = self.blocks.popleft()
+            except IndexError:
+                self.block_ready.wait(0.1)
+                self.block_ready.clear()
+                continue
+
+            self._check_late(enqueue_time)
+
+            try:
+                self.stream.write(data, exception_on_underflow=True)
+                self.written_count += 1
+            except OSError:
+                # The block was written, but the device had run dry
+                self.written_count += 1
+                self.underflow_count += 1
+            except Exception as error:
+                if self.telemetry is not None:
+                    self.telemetry.record_exception("write_exceptions", error)
+
+    # ----------------------------------------------------------------
+    def get_stats(self):
+        return {
+            "output": self.name,
+            "buffered": len(self.blocks),
+            "capacity": self.capacity,
+            "written": self.written_count,
+            "dropped": self.dropped_count,
+            "late": self.late_count,
+            "underflows": self.underflow_count,
+        }
@@ -0,0 +1,63 @@
+import threading
+import numpy as np
+
+
+class ParameterStore:
+    def __init__(self, **values):
+        # Writers copy the dict and swap the reference, so the audio thread
+        # reads a consistent snapshot without taking a lock
+        self.snapshot = dict(values)
+        self.lock = threading.Lock()
+
+    def set(self, name, value):
+        with self.lock:
+            snapshot = dict(self.snapshot)
+            snapshot[name] = value
+            self.snapshot = snapshot
+
+    def get(self, name):
+        return self.snapshot[name]
+
+    def get_snapshot(self):
+        return self.snapshot
+
+
+class SmoothedValue:
+    def __init__(self, value, max_step=None):
+        self.value = value
+
+        # largest change per block, None ramps to the target in one block
+        self.max_step = max_step
+
+        self.frame_count = 0
+        self.ramp_steps = np.zeros(0, dtype=np.float32)
+        self.ramp_buffer = np.zeros(0, dtype=np.float32)
+
+    def next_value(self, target):
+        # Step towards the target once per block
+        if self.max_step is not None:
+            target = min(
+                max(target, self.value - self.max_step), self.value + self.max_step
+            )
+
+        self.value = target
+        return self.value
+
+    def next_block(self, target, frame_count):
+        start = self.value
+        target = self.next_value(target)
+
+        if target == start:
+            return target
+
+        if frame_count != self.frame_count:
+            self.frame_count = frame_count
+            self.ramp_steps = np.arange(1, frame_count + 1, dtype=np.float32)
+            self.ramp_steps /= frame_count
+            self.ramp_buffer = np.zeros(frame_count, dtype=np.float32)
+
+        # Linear ramp over the block instead of a jump
+        np.multiply(self.ramp_steps, target - start, out=self.ramp_buffer)
+        self.ramp_buffer += start
+
+        return self.ramp_buffer
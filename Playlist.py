@@ -0,0 +1,227 @@
+import numpy as np
+
+
+class Playlist:
+    def __init__(self, crossfade_duration=0, sample_rate=44100, channels=1):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.crossfade_length = int(crossfade_duration * sample_rate)
+
+        self.tracks = []
+        self.index = 0
+
+        # precomputed playlist layout, replaced as a whole on every change
+        self.layout = self._build_layout(self.tracks)
+
+        self.output_buffer = np.zeros((channels, 0), dtype=np.float32)
+        self.mix_buffer = np.zeros((channels, 0), dtype=np.float32)
+
+    # ----------------------------------------------------------------
+    def add_track(self, track):
+        if track.length:
+            self._set_tracks(self.tracks + [track])
+
+    def clear(self):
+        tracks = self.tracks
+        self._set_tracks([])
+
+        for track in tracks:
+            track.close()
+
+    def set_crossfade_duration(self, duration):
+        self.crossfade_length = max(0, int(duration * self.sample_rate))
+        self._set_tracks(self.tracks)
+
+    def get_track_count(self):
+        return len(self.tracks)
+
+    def _set_tracks(self, tracks):
+        layout = self._build_layout(tracks)
+
+        self.tracks = tracks
+        self.layout = layout
+        self.index = min(self.index, max(0, len(tracks) - 1))
+
+    def _build_layout(self, tracks):
+        overlaps = []
+        fade_ramps = []
+        starts = []
+
+        start = 0
+        for i, track in enumerate(tracks):
+            next_track = tracks[(i + 1) % len(tracks)]
+
+            # A single looping track is joined gaplessly without a crossfade
+            overlap = 0
+            if next_track is not track:
+                overlap = min(
+                    self.crossfade_length, track.length // 2, next_track.length // 2
+                )
+
+            # Equal-power ramps, computed here and not in the audio thread
+            angle = np.linspace(0, np.pi / 2, overlap, dtype=np.float32)
+            fade_ramps.append((np.cos(angle), np.sin(angle)))
+
+            overlaps.append(overlap)
+            starts.append(start)
+            start += track.length - overlap
+
+        return tracks, overlaps, fade_ramps, starts, start
+
+    # ----------------------------------------------------------------
+    @property
+    def length(self):
+        return self.layout[4]
+
+    @property
+    def position(self):
+        tracks, _, _, starts, length = self.layout
+        if not length:
+            return 0
+
+        index = min(self.index, len(tracks) - 1)
+        return (starts[index] + tracks[index].position) % length
+
+    def seek(self, position):
+        tracks, _, _, starts, length = self.layout
+        if not length:
+            return
+
+        position = int(position) % length
+
+        index = 0
+        while index + 1 < len(tracks) and starts[index + 1] <= position:
+            index += 1
+
+        tracks[index].seek(position - starts[index])
+
+        # The next track must start from its beginning
+        next_track = tracks[(index + 1) % len(tracks)]
+        if next_track is not tracks[index]:
+            next_track.seek(0)
+
+        self.index = index
+
+    def set_position_percent(self, percent):
+        self.seek(self.length * percent / 100)
+
+    def get_position_percent(self):
+        if not self.length:
+            return 0
+        return self.position / self.length * 100
+
+    def close(self):
+        self.clear()
+
+    # ----------------------------------------------------------------
+    def read(self, frame_count, volume=1.0):
+        if self.output_buffer.shape[1] < frame_count:
+            shape = (self.channels, frame_count)
+            self.output_buffer = np.zeros(shape, dtype=np.float32)
+            self.mix_buffer = np.zeros(shape, dtype=np.float32)
+
+        # Planar (channels, frames) output, fade ramps apply to all channels
+        output_data = self.output_buffer[:, :frame_count]
+        output_data.fill(0)
+
+        tracks, overlaps, fade_ramps, _, length = self.layout
+        if not length:
+            return output_data
+
+        index = min(self.index, len(tracks) - 1)
+        position = tracks[index].position
+
+        # read offsets relative to the current positions of the tracks
+        offset = 0
+        next_offset = 0
+
+        filled = 0
+        while filled < frame_count:
+            track = tracks[index]
+            next_track = tracks[(index + 1) % len(tracks)]
+            fade_start = track.length - overlaps[index]
+
+            if position < fade_start:
+                count = min(frame_count - filled, fade_start - position)
+                self._mix_track(
+                    track, offset, volume, output_data[:, filled : filled + count]
+                )
+            else:
+                # Crossfade the end of this track with the next one
+                count = min(frame_count - filled, track.length - position)
+                ramp_position = position - fade_start
+                fade_out, fade_in = fade_ramps[index]
+
+                self._mix_track(
+                    track,
+                    offset,
+                    volume,
+                    output_data[:, filled : filled + count],
+                    fade_out[ramp_position : ramp_position + count],
+                )
+                self._mix_track(
+                    next_track,
+                    next_offset,
+                    volume,
+                    output_data[:, filled : filled + count],
+                    fade_in[ramp_position : ramp_position + count],
+                )
+                next_offset += count
+
+            filled += count
+            offset += count
+            position += count
+
+            if position >= track.length:
+                # Gapless transition, the next track continues after the fade
+                if len(tracks) > 1:
+                    position = overlaps[index]
+                    offset = next_offset
+                    next_offset = 0
+                else:
+                    position = 0
+
+                index = (index + 1) % len(tracks)
+
+        return output_data
+
+    def _mix_track(self, track, offset, volume, output_data, fade_ramp=None):
+        track_data = track.read(output_data.shape[1], volume, offset)
+
+        if fade_ramp is None:
+            output_data += track_data
+        else:
+            mixed_data = self.mix_buffer[:, : output_data.shape[1]]
+            np.multiply(track_data, fade_ramp, out=mixed_data)
+            output_data += mixed_data
+
+    def advance(self, frame_count):
+        tracks, overlaps, _, _, length = self.layout
+        if not length:
+            return
+
+        index = min(self.index, len(tracks) - 1)
+
+        while frame_count > 0:
+            track = tracks[index]
+            next_track = tracks[(index + 1) % len(tracks)]
+            fade_start = track.length - overlaps[index]
+            position = track.position
+
+            if position < fade_start:
+                count = min(frame_count, fade_start - position)
+                track.advance(count)
+            else:
+                count = min(frame_count, track.length - position)
+                track.advance(count)
+                next_track.advance(count)
+
+            frame_count -= count
+
+            if position + count >= track.length and len(tracks) > 1:
+                # Rewind a track that fell behind its decoder
+                if track.position != 0:
+                    track.seek(0)
+                index = (index + 1) % len(tracks)
+
+        self.index = index
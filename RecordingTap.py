@@ -0,0 +1,183 @@
+import os
+import time
+import threading
+import numpy as np
+
+
+class RecordingTap:
+    def __init__(
+        self,
+        directory,
+        sample_rate=44100,
+        channels=1,
+        block_size=256,
+        file_format="wav",
+        max_file_seconds=None,
+        max_file_bytes=None,
+        name="output",
+        capacity=512,
+    ):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_size = block_size
+        self.file_format = file_format.lower()
+        self.name = name
+
+        if self.file_format not in ["wav", "flac"]:
+            raise ValueError(f"Unsupported recording format: {file_format}")
+
+        # a new file is started when the current one gets this long or large
+        self.max_file_seconds = max_file_seconds
+        self.max_file_bytes = max_file_bytes
+
+        # preallocated ring of blocks with one producer (the audio thread)
+        # and one consumer (the writer thread), so neither ever waits
+        self.blocks = np.zeros((capacity, channels, block_size), dtype=np.float32)
+        self.frame_counts = np.zeros(capacity, dtype=np.int64)
+        self.capacity = capacity
+        self.write_index = 0
+        self.read_index = 0
+
+        self.file = None
+        self.file_path = None
+        self.file_frame_count = 0
+        self.file_count = 0
+
+        self.thread = None
+        self.is_running = False
+
+        # statistics
+        self.recorded_count = 0
+        self.dropped_count = 0
+        self.error_count = 0
+        self.last_error = None
+
+    # ----------------------------------------------------------------
+    def push(self, data):
+        # Called by the audio thread with planar (channels, frames) data
+        for start in range(0, data.shape[-1], self.block_size):
+            block = data[..., start : start + self.block_size]
+
+            if self.write_index - self.read_index >= self.capacity:
+                # The disk is too slow, the block is lost but audio goes on
+                self.dropped_count += 1
+                continue
+
+            index = self.write_index % self.capacity
+            frame_count = block.shape[-1]
+            self.blocks[index, :, :frame_count] = block
+            self.frame_counts[index] = frame_count
+
+            # Published only after the copy is complete
+            self.write_index += 1
+
+    # ----------------------------------------------------------------
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.is_running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        # Blocks pushed so far are still written
+        self.is_running = False
+
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self):
+        while True:
+            is_running = self.is_running
+
+            if self.read_index == self.write_index:
+                if not is_running:
+                    break
+                time.sleep(0.02)
+                continue
+
+            try:
+                self._write_blocks()
+            except Exception as error:
+                # The file is abandoned, the next blocks start a new one
+                self._record_error(error)
+                try:
+                    self._close_file()
+                except Exception as error:
+                    self._record_error(error)
+                time.sleep(0.5)
+
+        self._close_file()
+
+    def _write_blocks(self):
+        # Everything pushed so far, a slot is reused once its block is written
+        write_index = self.write_index
+
+        while self.read_index < write_index:
+            if self.file is None:
+                self._open_file()
+
+            index = self.read_index % self.capacity
+            frame_count = self.frame_counts[index]
+            self.file.write(self.blocks[index, :, :frame_count].T)
+            self.file_frame_count += frame_count
+
+            self.recorded_count += 1
+            self.read_index += 1
+
+            if self._should_rotate():
+                self._close_file()
+
+    def _should_rotate(self):
+        if self.max_file_seconds is not None:
+            if self.file_frame_count >= self.max_file_seconds * self.sample_rate:
+                return True
+
+        if self.max_file_bytes is not None:
+            if os.path.getsize(self.file_path) >= self.max_file_bytes:
+                return True
+
+        return False
+
+    def _open_file(self):
+        import soundfile as sf
+
+        self.file_count += 1
+        self.file_path = os.path.join(
+            self.directory,
+            f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}-{self.file_count:03}"
+            f".{self.file_format}",
+        )
+        self.file = sf.SoundFile(
+            self.file_path,
+            "w",
+            samplerate=self.sample_rate,
+            channels=self.channels,
+            subtype="PCM_16",
+            format=self.file_format.upper(),
+        )
+        self.file_frame_count = 0
+
+    def _close_file(self):
+        file, self.file = self.file, None
+        if file is not None:
+            file.close()
+
+    def _record_error(self, error):
+        self.error_count += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+
+    # ----------------------------------------------------------------
+    def get_stats(self):
+        return {
+            "output": self.name,
+            "file": self.file_path,
+            "files": self.file_count,
+            "buffered": self.write_index - self.read_index,
+            "recorded": self.recorded_count,
+            "dropped": self.dropped_count,
+            "errors": self.error_count,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,91 @@
+import threading
+import multiprocessing
+from functools import partial
+from DeviceManager import get_device_manager
+
+
+class RemoteDevice:
+    def __init__(self, **device_arguments):
+        # The whole engine (capture, processing and playback) runs in its own
+        # interpreter, so the GUI never holds the GIL the audio thread needs
+        context = multiprocessing.get_context("spawn")
+
+        # the control channel, one request and one reply at a time
+        self.connection, worker_connection = context.Pipe()
+        self.lock = threading.Lock()
+
+        self.process = context.Process(
+            target=run_device, args=(worker_connection, device_arguments), daemon=True
+        )
+        self.process.start()
+        worker_connection.close()
+
+    def __getattr__(self, name):
+        # Device methods are called remotely, device attributes are read
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return partial(self.call, name)
+
+    @property
+    def is_running(self):
+        return self.call("is_running")
+
+    def call(self, name, *args, **kwargs):
+        with self.lock:
+            self.connection.send((name, args, kwargs))
+            is_ok, result = self.connection.recv()
+
+        if not is_ok:
+            raise result
+        return result
+
+    def close(self, timeout=5.0):
+        # Stops the device if needed, then the worker process
+        if self.process.is_alive():
+            with self.lock:
+                self.connection.send((None, (), {}))
+
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+
+        self.connection.close()
+
+
+# ----------------------------------------------------------------
+def run_device(connection, device_arguments):
+    from VirtualMicroDevice import VirtualMicroDevice
+
+    device = VirtualMicroDevice(**device_arguments)
+
+    while True:
+        try:
+            name, args, kwargs = connection.recv()
+        except EOFError:
+            # The GUI is gone
+            break
+
+        if name is None:
+            break
+
+        try:
+            attribute = getattr(device, name)
+            if callable(attribute):
+                attribute = attribute(*args, **kwargs)
+            reply = (True, attribute)
+        except Exception as error:
+            reply = (False, error)
+
+        try:
+            connection.send(reply)
+        except Exception as error:
+            # Results and errors that cannot be pickled
+            connection.send((False, RuntimeError(f"{type(error).__name__}: {error}")))
+
+    if device.is_running:
+        device.stop()
+
+    for output in range(len(device.output_stages)):
+        device.stop_recording(output)
+
+    get_device_manager().terminate()
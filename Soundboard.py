@@ -0,0 +1,189 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict, deque
+
+
+class Soundboard:
+    def __init__(
+        self,
+        sample_rate=44100,
+        channels=1,
+        block_size=256,
+        memory_budget=64 * 1024**2,
+        max_voices=16,
+        history=256,
+    ):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.max_voices = max_voices
+
+        # decoded clips (channels, frames) in least recently used order, and
+        # their files, so evicted clips can be decoded again
+        self.clips = OrderedDict()
+        self.clip_files = {}
+        self.memory_budget = memory_budget
+        self.memory_size = 0
+        self.lock = threading.Lock()
+
+        # triggered clips, picked up by the audio thread at the next block
+        self.triggers = deque()
+        self.stop_requested = False
+
+        # playing clips: [clip, position, gain], owned by the audio thread
+        self.voices = []
+        self.mix_buffer = np.zeros((channels, block_size), dtype=np.float32)
+
+        # trigger to first mixed block delays (seconds)
+        self.trigger_latencies = np.zeros(history)
+        self.trigger_count = 0
+
+    # ----------------------------------------------------------------
+    def load_clip(self, name, file_path):
+        # Decoded on the calling thread, never on the audio thread
+        clip = self._decode(file_path)
+
+        with self.lock:
+            self._remove_clip(name)
+            self._evict(clip.nbytes)
+
+            self.clips[name] = clip
+            self.clip_files[name] = file_path
+            self.memory_size += clip.nbytes
+
+        return clip
+
+    def remove_clip(self, name):
+        with self.lock:
+            self._remove_clip(name)
+            self.clip_files.pop(name, None)
+
+    def get_clip_names(self):
+        return list(self.clip_files)
+
+    def set_memory_budget(self, memory_budget):
+        with self.lock:
+            self.memory_budget = memory_budget
+            self._evict(0)
+
+    def _remove_clip(self, name):
+        clip = self.clips.pop(name, None)
+        if clip is not None:
+            self.memory_size -= clip.nbytes
+
+    def _evict(self, size):
+        if size > self.memory_budget:
+            raise ValueError("Clip is larger than the soundboard memory budget")
+
+        # Playing voices keep their own reference, eviction is always safe
+        while self.clips and self.memory_size + size > self.memory_budget:
+            _, clip = self.clips.popitem(last=False)
+            self.memory_size -= clip.nbytes
+
+    def _decode(self, file_path):
+        # Heavy libraries are imported on first use, like for the tracks
+        import soundfile as sf
+
+        try:
+            audio_data, file_rate = sf.read(file_path, dtype="float32", always_2d=True)
+        except RuntimeError:
+            import librosa
+
+            audio_data, file_rate = librosa.load(file_path, sr=None, mono=False)
+            audio_data = np.atleast_2d(audio_data).T
+
+        if file_rate != self.sample_rate:
+            import soxr
+
+            audio_data = soxr.resample(audio_data, file_rate, self.sample_rate)
+
+        # Planar clips with the output channels
+        audio_data = audio_data.T
+        if audio_data.shape[0] != self.channels:
+            audio_data = np.repeat(
+                np.mean(audio_data, axis=0, keepdims=True), self.channels, axis=0
+            )
+
+        clip = np.ascontiguousarray(audio_data, dtype=np.float32)
+        clip.setflags(write=False)
+        return clip
+
+    # ----------------------------------------------------------------
+    def trigger(self, name, gain=1.0):
+        with self.lock:
+            clip = self.clips.get(name)
+
+            if clip is not None:
+                self.clips.move_to_end(name)
+
+        if clip is None:
+            if name not in self.clip_files:
+                raise ValueError(f"Unknown clip: {name}")
+
+            # Evicted earlier, decoded again before it is queued
+            clip = self.load_clip(name, self.clip_files[name])
+
+        self.triggers.append((clip, max(0, gain), time.perf_counter()))
+
+    def stop(self):
+        self.stop_requested = True
+
+    def is_playing(self):
+        return bool(self.voices or self.triggers)
+
+    def read(self, frame_count):
+        # Called by the audio thread, None while nothing is playing
+        if self.stop_requested:
+            self.stop_requested = False
+            self.triggers.clear()
+            self.voices = []
+
+        now = time.perf_counter()
+        while self.triggers:
+            clip, gain, trigger_time = self.triggers.popleft()
+            self.voices.append([clip, 0, gain])
+
+            self.trigger_latencies[self.trigger_count % len(self.trigger_latencies)] = (
+                now - trigger_time
+            )
+            self.trigger_count += 1
+
+        if not self.voices:
+            return None
+
+        # The oldest voices are cut when too many clips overlap
+        del self.voices[: -self.max_voices]
+
+        if self.mix_buffer.shape[1] < frame_count:
+            self.mix_buffer = np.zeros((self.channels, frame_count), dtype=np.float32)
+
+        mixed_data = self.mix_buffer[:, :frame_count]
+        mixed_data.fill(0)
+
+        for voice in self.voices:
+            clip, position, gain = voice
+            count = min(frame_count, clip.shape[1] - position)
+            mixed_data[:, :count] += clip[:, position : position + count] * gain
+            voice[1] += count
+
+        self.voices = [voice for voice in self.voices if voice[1] < voice[0].shape[1]]
+
+        return mixed_data
+
+    # ----------------------------------------------------------------
+    def get_stats(self):
+        trigger_count = min(self.trigger_count, len(self.trigger_latencies))
+        trigger_latencies = self.trigger_latencies[:trigger_count]
+        if not trigger_count:
+            trigger_latencies = np.zeros(1)
+
+        return {
+            "clips": len(self.clip_files),
+            "cached_clips": len(self.clips),
+            "memory_bytes": self.memory_size,
+            "memory_budget": self.memory_budget,
+            "voices": len(self.voices),
+            "triggers": self.trigger_count,
+            "trigger_latency_mean": float(np.mean(trigger_latencies)),
+            "trigger_latency_max": float(np.max(trigger_latencies)),
+        }
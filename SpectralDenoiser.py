@@ -0,0 +1,156 @@
+import numpy as np
+from math import gcd, ceil
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class SpectralDenoiser:
+    def __init__(self, sample_rate=44100, block_size=256, fft_size=512, hop_size=128):
+        self.sample_rate = sample_rate
+        self.fft_size = fft_size
+        self.hop_size = hop_size
+        self.overlap_size = fft_size - hop_size
+
+        # periodic Hann analysis and synthesis windows, scaled so the
+        # overlapped products add up to one
+        window = np.hanning(fft_size + 1)[:-1]
+        window *= np.sqrt(hop_size / np.sum(window**2))
+        self.window = window.astype(np.float32)
+
+        # spectral subtraction settings
+        self.over_subtraction = 2.0
+        self.gain_floor = 0.1
+
+        # learned noise magnitude per bin, None until learn_noise() is done
+        self.noise_magnitude = None
+        self.learning_frame_count = 0
+        self.noise_sum = np.zeros(fft_size // 2 + 1)
+        self.noise_frame_count = 0
+
+        self.reset(block_size)
+
+    def reset(self, block_size=None):
+        # Clears the streaming state, the noise profile is kept
+        if block_size is not None:
+            self.block_size = block_size
+
+        # Blocks that are not a multiple of the hop size are padded with
+        # silence, so the output never runs dry
+        self.prefill = self.hop_size - gcd(self.block_size, self.hop_size)
+
+        # input samples not analyzed yet, after the overlap of the last frame
+        self.input_buffer = np.zeros(
+            self.fft_size + self.block_size + self.hop_size, dtype=np.float32
+        )
+        self.input_count = self.overlap_size
+
+        # synthesized tail of the last frames and finished output samples
+        self.overlap_buffer = np.zeros(self.overlap_size, dtype=np.float32)
+        self.output_buffer = np.zeros(
+            self.prefill + self.block_size + self.hop_size, dtype=np.float32
+        )
+        self.output_count = self.prefill
+
+    @property
+    def latency(self):
+        # algorithmic latency (seconds), the overlap and the padding
+        return (self.overlap_size + self.prefill) / self.sample_rate
+
+    # ----------------------------------------------------------------
+    def learn_noise(self, duration=1.0):
+        # The profile is averaged over the next frames, they should
+        # contain only background noise
+        self.noise_sum.fill(0)
+        self.noise_frame_count = 0
+        self.learning_frame_count = ceil(duration * self.sample_rate / self.hop_size)
+
+    def is_learning(self):
+        return self.learning_frame_count > 0
+
+    def _learn(self, magnitude):
+        magnitude = magnitude[: self.learning_frame_count]
+        self.noise_sum += np.sum(magnitude, axis=0)
+        self.noise_frame_count += len(magnitude)
+        self.learning_frame_count -= len(magnitude)
+
+        if self.learning_frame_count == 0:
+            self.noise_magnitude = (self.noise_sum / self.noise_frame_count).astype(
+                np.float32
+            )
+
+    # ----------------------------------------------------------------
+    def process(self, data, strength=1.0):
+        frame_count = len(data)
+        self.input_buffer = self._append(self.input_buffer, self.input_count, data)
+        self.input_count += frame_count
+
+        # All complete frames of the block are analyzed at once
+        stft_frame_count = (self.input_count - self.overlap_size) // self.hop_size
+        if stft_frame_count:
+            self._process_frames(stft_frame_count, strength)
+
+        # Finished samples, or silence on an irregular block
+        output_data = np.zeros(frame_count, dtype=np.float32)
+        count = min(frame_count, self.output_count)
+        output_data[frame_count - count :] = self.output_buffer[:count]
+
+        self.output_count -= count
+        self.output_buffer[: self.output_count] = self.output_buffer[
+            count : count + self.output_count
+        ]
+
+        return output_data
+
+    def _process_frames(self, stft_frame_count, strength):
+        size = self.overlap_size + stft_frame_count * self.hop_size
+        frames = sliding_window_view(self.input_buffer[:size], self.fft_size)
+        frames = frames[:: self.hop_size]
+
+        spectra = np.fft.rfft(frames * self.window, axis=1)
+        magnitude = np.abs(spectra)
+
+        if self.learning_frame_count:
+            self._learn(magnitude)
+
+        if self.noise_magnitude is not None and strength > 0:
+            # Over-subtracted magnitude gain with a floor against musical noise
+            gain = 1 - self.over_subtraction * self.noise_magnitude / np.maximum(
+                magnitude, 1e-9
+            )
+            np.clip(gain, self.gain_floor, 1, out=gain)
+            spectra *= 1 - strength * (1 - gain)
+
+        frames = np.fft.irfft(spectra, self.fft_size, axis=1) * self.window
+
+        # Overlap-add, each frame spans fft_size / hop_size hops
+        output_data = np.zeros(size, dtype=np.float32)
+        output_data[: self.overlap_size] = self.overlap_buffer
+        hops = output_data.reshape(-1, self.hop_size)
+        frames = frames.reshape(stft_frame_count, -1, self.hop_size)
+        for i in range(frames.shape[1]):
+            hops[i : i + stft_frame_count] += frames[:, i]
+
+        finished_count = stft_frame_count * self.hop_size
+        self.overlap_buffer[:] = output_data[
+            finished_count : finished_count + self.overlap_size
+        ]
+
+        self.output_buffer = self._append(
+            self.output_buffer, self.output_count, output_data[:finished_count]
+        )
+        self.output_count += finished_count
+
+        # Keep the overlap and the samples of the next frame
+        self.input_count -= finished_count
+        self.input_buffer[: self.input_count] = self.input_buffer[
+            finished_count : finished_count + self.input_count
+        ]
+
+    def _append(self, buffer, count, data):
+        # Buffers grow only for blocks larger than expected
+        if count + len(data) > len(buffer):
+            new_buffer = np.zeros(2 * (count + len(data)), dtype=np.float32)
+            new_buffer[:count] = buffer[:count]
+            buffer = new_buffer
+
+        buffer[count : count + len(data)] = data
+        return buffer
@@ -0,0 +1,81 @@
+import numpy as np
+from math import gcd
+from functools import lru_cache
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+@lru_cache(maxsize=None)
+def get_polyphase_filter(from_rate, to_rate, taps_per_phase=32):
+    # Windowed-sinc lowpass split into one short filter per output phase,
+    # designed once for every rate pair
+    divisor = gcd(int(from_rate), int(to_rate))
+    up = int(to_rate) // divisor
+    down = int(from_rate) // divisor
+
+    # cutoff slightly below the lower Nyquist frequency
+    cutoff = 0.95 / max(up, down)
+    length = taps_per_phase * up
+    time = np.arange(length) - (length - 1) / 2
+
+    prototype = cutoff * np.sinc(cutoff * time) * np.kaiser(length, 9.0)
+    prototype *= up / np.sum(prototype)
+
+    # phase p uses taps p, p + up, p + 2 * up, ... in reverse input order
+    filter_bank = prototype.reshape(taps_per_phase, up).T.astype(np.float32)
+    filter_bank.setflags(write=False)
+
+    return up, down, filter_bank
+
+
+class StreamResampler:
+    def __init__(self, from_rate, to_rate, channels=1, taps_per_phase=32):
+        self.from_rate = from_rate
+        self.to_rate = to_rate
+        self.channels = channels
+
+        self.up, self.down, self.filter_bank = get_polyphase_filter(
+            from_rate, to_rate, taps_per_phase
+        )
+        self.taps = taps_per_phase
+
+        # filter state carried across blocks: the last input samples and
+        # the position of the next output sample, in 1 / up input samples
+        self.history = np.zeros((channels, self.taps - 1), dtype=np.float32)
+        self.position = 0
+
+        # group delay of the filter (seconds)
+        self.delay = self.taps / 2 / from_rate
+
+    def reset(self):
+        self.history.fill(0)
+        self.position = 0
+
+    # ----------------------------------------------------------------
+    def process(self, data):
+        # Mono blocks are 1D, multichannel blocks are planar (channels, frames)
+        is_mono = data.ndim == 1
+        data = data.reshape(self.channels, -1)
+        frame_count = data.shape[1]
+
+        buffered_data = np.concatenate([self.history, data], axis=1)
+
+        # Every output sample whose input position falls into this block
+        output_count = -(-(frame_count * self.up - self.position) // self.down)
+        output_count = max(0, output_count)
+
+        positions = self.position + np.arange(output_count) * self.down
+        indices, phases = np.divmod(positions, self.up)
+
+        # Input windows as strided views, newest sample first to match the
+        # filter phases
+        windows = sliding_window_view(buffered_data, self.taps, axis=1)
+        output_data = np.einsum(
+            "cmt,mt->cm", windows[:, indices, ::-1], self.filter_bank[phases]
+        )
+
+        self.position += output_count * self.down - frame_count * self.up
+        self.history = buffered_data[:, -(self.taps - 1) :]
+
+        if is_mono:
+            return output_data[0]
+        return output_data
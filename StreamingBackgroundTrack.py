@@ -0,0 +1,230 @@
+import soxr
+import threading
+import numpy as np
+import soundfile as sf
+
+
+class StreamingBackgroundTrack:
+    def __init__(
+        self,
+        file_path,
+        sample_rate,
+        channels=1,
+        prefetch_seconds=2.0,
+        block_size=4096,
+        audio_koeff=None,
+    ):
+        self.file = sf.SoundFile(file_path)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_size = block_size
+
+        # track length and playback position in output samples
+        self.length = round(self.file.frames * sample_rate / self.file.samplerate)
+        self.position = 0
+
+        # streaming resampler, its state carries across decoded blocks
+        self.resampler = soxr.ResampleStream(
+            self.file.samplerate, sample_rate, channels, dtype="float32"
+        )
+
+        # bounded prefetch ring buffer filled by the decoder thread
+        self.max_block_size = int(
+            np.ceil(block_size * sample_rate / self.file.samplerate)
+        )
+        self.max_block_size += 64
+        capacity = max(int(prefetch_seconds * sample_rate), 2 * self.max_block_size)
+        self.ring_buffer = np.zeros((capacity, channels), dtype=np.float32)
+        self.read_index = 0
+        self.write_index = 0
+
+        self.output_buffer = np.zeros((channels, 0), dtype=np.float32)
+
+        # Normalized like a decoded track; with the peak unknown, playback
+        # starts at the file level and ramps to the normalized gain once the
+        # track cache has measured it, see set_peak()
+        self.audio_gain = 1 / audio_koeff if audio_koeff else 1
+        self.target_gain = self.audio_gain
+        self.next_gain = self.audio_gain
+        self.gain_step = 0
+        self.ramp_steps = np.zeros(0, dtype=np.float32)
+        self.gain_ramp = np.zeros(0, dtype=np.float32)
+
+        # seek requests from the UI thread
+        self.seek_position = None
+
+        # a file that can't be decoded stops the decoder, playing silence
+        self.last_error = None
+
+        self.condition = threading.Condition()
+        self.is_running = True
+        self.thread = threading.Thread(target=self._decode, daemon=True)
+        self.thread.start()
+
+    # ----------------------------------------------------------------
+    def seek(self, position):
+        if not self.length:
+            return
+
+        with self.condition:
+            self.position = int(position) % self.length
+            self.seek_position = self.position
+
+            # Drop stale prefetched audio
+            self.read_index = self.write_index
+            self.condition.notify()
+
+    def advance(self, frame_count):
+        with self.condition:
+            frame_count = min(frame_count, self.write_index - self.read_index)
+            self.read_index += frame_count
+            self.audio_gain = self.next_gain
+            if self.length:
+                self.position = (self.position + frame_count) % self.length
+            self.condition.notify()
+
+    def set_peak(self, audio_koeff, ramp_seconds=0.5):
+        # Called by the track cache when the stored copy is written
+        target_gain = 1 / audio_koeff if audio_koeff > 0 else 1
+        self.gain_step = abs(target_gain - self.audio_gain) / (
+            ramp_seconds * self.sample_rate
+        )
+        self.target_gain = target_gain
+
+    def set_position_percent(self, percent):
+        self.seek(self.length * percent / 100)
+
+    def get_position_percent(self):
+        if not self.length:
+            return 0
+        return self.position / self.length * 100
+
+    def get_prefetched_frame_count(self):
+        return self.write_index - self.read_index
+
+    def close(self):
+        with self.condition:
+            self.is_running = False
+            self.condition.notify()
+        self.thread.join()
+        self.file.close()
+
+    # ----------------------------------------------------------------
+    def read(self, frame_count, volume=1.0, offset=0):
+        if self.output_buffer.shape[1] < frame_count:
+            self.output_buffer = np.zeros(
+                (self.channels, frame_count), dtype=np.float32
+            )
+
+        # Planar (channels, frames) output
+        output_data = self.output_buffer[:, :frame_count]
+        output_data.fill(0)
+
+        with self.condition:
+            # Underrun plays silence until the decoder catches up
+            available = self.write_index - self.read_index - offset
+            available = max(0, min(frame_count, available))
+            self._copy_from_ring(self.read_index + offset, output_data[:, :available].T)
+
+        output_data *= volume
+        output_data *= self._get_gain(frame_count)
+        return output_data
+
+    def _get_gain(self, frame_count):
+        # Linear ramp towards the target gain, advance() moves on to its end
+        start = self.audio_gain
+        step = self.gain_step * frame_count
+        self.next_gain = min(max(self.target_gain, start - step), start + step)
+        if self.next_gain == start:
+            return start
+
+        if len(self.ramp_steps) != frame_count:
+            self.ramp_steps = np.arange(1, frame_count + 1, dtype=np.float32)
+            self.ramp_steps /= frame_count
+            self.gain_ramp = np.zeros(frame_count, dtype=np.float32)
+
+        np.multiply(self.ramp_steps, self.next_gain - start, out=self.gain_ramp)
+        self.gain_ramp += start
+        return self.gain_ramp
+
+    def _copy_from_ring(self, index, output_data):
+        capacity = len(self.ring_buffer)
+        start = index % capacity
+        count = min(len(output_data), capacity - start)
+
+        output_data[:count] = self.ring_buffer[start : start + count]
+        output_data[count:] = self.ring_buffer[: len(output_data) - count]
+
+    def _copy_to_ring(self, index, data):
+        capacity = len(self.ring_buffer)
+        start = index % capacity
+        count = min(len(data), capacity - start)
+
+        self.ring_buffer[start : start + count] = data[:count]
+        self.ring_buffer[: len(data) - count] = data[count:]
+
+    def _match_channels(self, decoded_data):
+        if self.channels == 1:
+            return decoded_data.mean(axis=1, keepdims=True)
+
+        # Mono files are spread over all channels, extra channels dropped
+        if decoded_data.shape[1] == 1:
+            return np.repeat(decoded_data, self.channels, axis=1)
+        return np.ascontiguousarray(decoded_data[:, : self.channels])
+
+    # ----------------------------------------------------------------
+    def _decode(self):
+        try:
+            self._decode_blocks()
+        except RuntimeError as error:
+            self.last_error = f"{type(error).__name__}: {error}"
+
+    def _decode_blocks(self):
+        capacity = len(self.ring_buffer)
+        rewound = False
+
+        while True:
+            with self.condition:
+                # Wait for free space in the prefetch buffer
+                while self.is_running and self.seek_position is None:
+                    if capacity - (self.write_index - self.read_index) >= (
+                        self.max_block_size
+                    ):
+                        break
+                    self.condition.wait()
+
+                if not self.is_running:
+                    return
+
+                seek_position = self.seek_position
+                self.seek_position = None
+
+            if seek_position is not None:
+                self.file.seek(
+                    int(seek_position * self.file.samplerate / self.sample_rate)
+                )
+                self.resampler.clear()
+
+            decoded_data = self.file.read(
+                self.block_size, dtype="float32", always_2d=True
+            )
+            if rewound and not len(decoded_data):
+                # Nothing to loop, an empty or unreadable file
+                raise RuntimeError(f"No audio frames in {self.file.name}")
+
+            rewound = len(decoded_data) < self.block_size
+            if rewound:
+                # Loop without flushing the resampler, so the loop is gapless
+                self.file.seek(0)
+
+            resampled_data = self.resampler.resample_chunk(
+                self._match_channels(decoded_data)
+            )
+
+            with self.condition:
+                # A seek while decoding makes this block stale
+                if self.seek_position is not None:
+                    continue
+
+                self._copy_to_ring(self.write_index, resampled_data)
+                self.write_index += len(resampled_data)
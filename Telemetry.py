@@ -0,0 +1,167 @@
+import time
+import numpy as np
+
+
+class Telemetry:
+    # processing stages timed in every block, "block" is the whole block
+    stages = [
+        "decode",
+        "denoiser",
+        "noise_gate",
+        "convolution",
+        "voice_effects",
+        "background",
+        "audio_reverb",
+        "soundboard",
+        "mix",
+        "block",
+    ]
+
+    counters = [
+        "input_overflows",
+        "deadline_misses",
+        "process_exceptions",
+        "write_exceptions",
+    ]
+
+    def __init__(self, sample_rate=44100, history=1024):
+        self.sample_rate = sample_rate
+        self.history = history
+
+        # recent stage durations (seconds), one row per stage, written by the
+        # audio thread without locks or allocations
+        self.stage_indices = {stage: i for i, stage in enumerate(self.stages)}
+        self.stage_times = np.zeros((len(self.stages), history))
+        self.budget_usage = np.zeros(history)
+
+        self.reset()
+
+    def reset(self):
+        self.stage_times.fill(0)
+        self.budget_usage.fill(0)
+
+        self.index = 0
+        self.block_count = 0
+        self.counts = {counter: 0 for counter in self.counters}
+        self.last_exception = None
+
+    # ----------------------------------------------------------------
+    def record(self, stage, start_time):
+        # Returns the current time, so the next stage can start from it
+        now = time.perf_counter()
+        self.stage_times[self.stage_indices[stage], self.index] = now - start_time
+        return now
+
+    def end_block(self, start_time, frame_count):
+        block_time = time.perf_counter() - start_time
+        budget_usage = block_time * self.sample_rate / frame_count
+
+        self.stage_times[self.stage_indices["block"], self.index] = block_time
+        self.budget_usage[self.index] = budget_usage
+
+        if budget_usage > 1:
+            self.counts["deadline_misses"] += 1
+
+        self.index = (self.index + 1) % self.history
+        self.block_count += 1
+
+        # Stages skipped in the next block must not keep old timings
+        self.stage_times[:, self.index] = 0
+
+    def count(self, counter, value=1):
+        self.counts[counter] += value
+
+    def record_exception(self, counter, error):
+        self.counts[counter] += 1
+        self.last_exception = f"{type(error).__name__}: {error}"
+
+    # ----------------------------------------------------------------
+    def get_snapshot(self):
+        # Called from other threads, statistics are computed here and
+        # not in the audio thread
+        block_count = min(self.block_count, self.history)
+        stage_times = self.stage_times[:, :block_count]
+        budget_usage = self.budget_usage[:block_count]
+
+        stages = {}
+        for stage, i in self.stage_indices.items():
+            times = stage_times[i] if block_count else np.zeros(1)
+            stages[stage] = {
+                "mean_us": float(np.mean(times)) * 1e6,
+                "p99_us": float(np.percentile(times, 99)) * 1e6,
+                "max_us": float(np.max(times)) * 1e6,
+            }
+
+        if not block_count:
+            budget_usage = np.zeros(1)
+
+        return {
+            "blocks": self.block_count,
+            "budget_usage": float(np.mean(budget_usage)),
+            "budget_usage_max": float(np.max(budget_usage)),
+            "stages": stages,
+            "counters": dict(self.counts),
+            "last_exception": self.last_exception,
+        }
+
+
+def format_prometheus(snapshot):
+    lines = [
+        "# TYPE virtual_micro_blocks_total counter",
+        f"virtual_micro_blocks_total {snapshot['blocks']}",
+        "# TYPE virtual_micro_budget_usage gauge",
+        f"virtual_micro_budget_usage {snapshot['budget_usage']:.6f}",
+        "# TYPE virtual_micro_budget_usage_max gauge",
+        f"virtual_micro_budget_usage_max {snapshot['budget_usage_max']:.6f}",
+    ]
+
+    for name, metric in [("mean_us", "mean"), ("p99_us", "p99"), ("max_us", "max")]:
+        lines.append(f"# TYPE virtual_micro_stage_{metric}_seconds gauge")
+        for stage, times in snapshot["stages"].items():
+            lines.append(
+                f'virtual_micro_stage_{metric}_seconds{{stage="{stage}"}} '
+                f"{times[name] / 1e6:.9f}"
+            )
+
+    for counter, value in snapshot["counters"].items():
+        lines.append(f"# TYPE virtual_micro_{counter}_total counter")
+        lines.append(f"virtual_micro_{counter}_total {value}")
+
+    # per-input and per-output buffer counters, added by the device
+    for counter in ["overflows", "underflows"]:
+        lines.append(f"# TYPE virtual_micro_input_{counter}_total counter")
+        for input in snapshot.get("inputs", []):
+            lines.append(
+                f'virtual_micro_input_{counter}_total{{input="{input["input"]}"}} '
+                f"{input[counter]}"
+            )
+
+    for counter in ["written", "dropped", "late", "underflows"]:
+        lines.append(f"# TYPE virtual_micro_output_{counter}_total counter")
+        for output in snapshot.get("outputs", []):
+            lines.append(
+                f'virtual_micro_output_{counter}_total{{output="{output["output"]}"}} '
+                f"{output[counter]}"
+            )
+
+    for counter in ["recorded", "dropped", "errors"]:
+        lines.append(f"# TYPE virtual_micro_recording_{counter}_total counter")
+        for recording in snapshot.get("recordings", []):
+            lines.append(
+                f"virtual_micro_recording_{counter}_total"
+                f'{{output="{recording["output"]}"}} {recording[counter]}'
+            )
+
+    soundboard = snapshot.get("soundboard")
+    if soundboard is not None:
+        lines += [
+            "# TYPE virtual_micro_soundboard_triggers_total counter",
+            f"virtual_micro_soundboard_triggers_total {soundboard['triggers']}",
+            "# TYPE virtual_micro_soundboard_memory_bytes gauge",
+            f"virtual_micro_soundboard_memory_bytes {soundboard['memory_bytes']}",
+            "# TYPE virtual_micro_soundboard_trigger_latency_seconds gauge",
+            "virtual_micro_soundboard_trigger_latency_seconds "
+            f"{soundboard['trigger_to_audio_latency']:.6f}",
+        ]
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,60 @@
+import json
+import threading
+from Telemetry import format_prometheus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class TelemetryRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # JSON for scripts, Prometheus text format for the monitoring
+        if self.path == "/telemetry":
+            body = json.dumps(self.server.get_snapshot()).encode("utf-8")
+            content_type = "application/json"
+        elif self.path == "/metrics":
+            body = format_prometheus(self.server.get_snapshot()).encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TelemetryHTTPServer(ThreadingHTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class TelemetryServer:
+    def __init__(self, get_snapshot, host="127.0.0.1", port=7701):
+        self.get_snapshot = get_snapshot
+        self.host = host
+        self.port = port
+
+        self.server = None
+        self.thread = None
+
+    # ----------------------------------------------------------------
+    def start(self):
+        # Bind to localhost only, like the control server
+        self.server = TelemetryHTTPServer(
+            (self.host, self.port), TelemetryRequestHandler
+        )
+        self.server.get_snapshot = self.get_snapshot
+
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
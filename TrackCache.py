@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+from contextlib import contextmanager
+
+
+class TrackCache:
+    def __init__(self, cache_dir=None, max_size=2 * 1024**3):
+        if cache_dir is None:
+            cache_dir = os.path.join(
+                os.path.expanduser("~"), ".cache", "virtual-micro", "tracks"
+            )
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.index_path = os.path.join(cache_dir, "index.json")
+
+        # other processes (the engine process, offline render workers) share
+        # the directory: the index on disk is the only copy that counts, it
+        # is read and written under the lock file
+        self.lock_path = os.path.join(cache_dir, "index.lock")
+
+        self.lock = threading.Lock()
+        # keys being stored, with the callbacks that get the measured peak
+        self.pending_keys = {}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._read_index()
+
+    # ----------------------------------------------------------------
+    def get_key(self, file_path, sample_rate, mono=True):
+        stat = os.stat(file_path)
+        key = "|".join(
+            [
+                os.path.abspath(file_path),
+                str(stat.st_mtime_ns),
+                str(stat.st_size),
+                str(sample_rate),
+                "mono" if mono else "stereo",
+            ]
+        )
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def load(self, file_path, sample_rate, mono=True):
+        key = self.get_key(file_path, sample_rate, mono)
+
+        with self.lock, self._lock_index():
+            self.index = self._read_index()
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+
+            try:
+                # Memory-mapped, so a hit costs no decoding or copying
+                audio_data = np.load(self._get_data_path(key), mmap_mode="r")
+            except (OSError, ValueError):
+                self._remove_entry(key)
+                self._write_index()
+                return None
+
+            entry["last_used"] = time.time()
+            self._write_index()
+
+        return audio_data[: entry["length"]], entry["peak"]
+
+    def store_async(
+        self, file_path, sample_rate, mono=True, audio_data=None, on_stored=None
+    ):
+        # on_stored(peak) is called from the store thread once the track is
+        # written, streamed tracks are normalized with it
+        key = self.get_key(file_path, sample_rate, mono)
+
+        with self.lock:
+            if key in self.pending_keys:
+                if on_stored is not None:
+                    self.pending_keys[key].append(on_stored)
+                return
+            if key in self.index:
+                return
+            self.pending_keys[key] = [on_stored] if on_stored is not None else []
+
+        threading.Thread(
+            target=self._store,
+            args=(key, file_path, sample_rate, mono, audio_data),
+            daemon=True,
+        ).start()
+
+    def clear(self):
+        with self.lock, self._lock_index():
+            self.index = self._read_index()
+            for key in list(self.index):
+                self._remove_entry(key)
+            self._write_index()
+
+    # ----------------------------------------------------------------
+    def _store(self, key, file_path, sample_rate, mono, audio_data):
+        temp_path = os.path.join(self.cache_dir, f"{key}.tmp.npy")
+
+        try:
+            if audio_data is not None:
+                length, peak = self._write_array(temp_path, audio_data)
+            else:
+                try:
+                    length, peak = self._write_stream(
+                        temp_path, file_path, sample_rate, mono
+                    )
+                except RuntimeError:
+                    import librosa
+
+                    audio_data, _ = librosa.load(file_path, sr=sample_rate, mono=mono)
+                    if not mono:
+                        audio_data = audio_data.T
+                    length, peak = self._write_array(temp_path, audio_data)
+
+            with self.lock, self._lock_index():
+                self.index = self._read_index()
+                os.replace(temp_path, self._get_data_path(key))
+                self.index[key] = {
+                    "path": os.path.abspath(file_path),
+                    "length": length,
+                    "peak": peak,
+                    "size": os.path.getsize(self._get_data_path(key)),
+                    "last_used": time.time(),
+                }
+                self._evict()
+                self._write_index()
+
+            with self.lock:
+                callbacks = self.pending_keys.pop(key, [])
+            for callback in callbacks:
+                callback(peak)
+
+        except (OSError, RuntimeError, ValueError):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        finally:
+            with self.lock:
+                self.pending_keys.pop(key, None)
+
+    def _write_array(self, path, audio_data):
+        audio_data = np.asarray(audio_data, dtype=np.float32)
+        np.save(path, audio_data)
+
+        peak = float(np.max(np.abs(audio_data))) if len(audio_data) else 0
+        return len(audio_data), peak
+
+    def _write_stream(self, path, file_path, sample_rate, mono, block_size=65536):
+        import soxr
+        import soundfile as sf
+
+        # Decode and resample in blocks, so memory does not grow with the file
+        with sf.SoundFile(file_path) as file:
+            channels = 1 if mono else file.channels
+            ratio = sample_rate / file.samplerate
+            max_length = int(np.ceil(file.frames * ratio)) + 64
+
+            shape = (max_length,) if mono else (max_length, channels)
+            audio_data = np.lib.format.open_memmap(
+                path, mode="w+", dtype=np.float32, shape=shape
+            )
+
+            resampler = soxr.ResampleStream(
+                file.samplerate, sample_rate, channels, dtype="float32"
+            )
+
+            length = 0
+            peak = 0
+            while True:
+                decoded_data = file.read(block_size, dtype="float32", always_2d=True)
+                last = len(decoded_data) < block_size
+
+                if mono:
+                    decoded_data = decoded_data.mean(axis=1)
+
+                resampled_data = resampler.resample_chunk(decoded_data, last=last)
+                resampled_data = resampled_data[: max_length - length]
+
+                audio_data[length : length + len(resampled_data)] = resampled_data
+                length += len(resampled_data)
+                if len(resampled_data):
+                    peak = max(peak, float(np.max(np.abs(resampled_data))))
+
+                if last:
+                    break
+
+            audio_data.flush()
+            del audio_data
+
+        return length, peak
+
+    # ----------------------------------------------------------------
+    def _evict(self):
+        # Tracks left out of the index (by a crash, or by a process that
+        # overwrote it) are removed, so they never escape the size limit
+        for file_name in os.listdir(self.cache_dir):
+            key, extension = os.path.splitext(file_name)
+            if extension == ".npy" and "." not in key and key not in self.index:
+                self._remove_entry(key)
+
+        # Drop least recently used tracks until the cache fits
+        total_size = sum(entry["size"] for entry in self.index.values())
+
+        for key in sorted(self.index, key=lambda key: self.index[key]["last_used"]):
+            if total_size <= self.max_size:
+                break
+            total_size -= self.index[key]["size"]
+            self._remove_entry(key)
+
+    def _remove_entry(self, key):
+        self.index.pop(key, None)
+        try:
+            os.remove(self._get_data_path(key))
+        except OSError:
+            pass
+
+    def _get_data_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self):
+        # Written whole and swapped in, readers never see a partial index
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.index, file)
+        os.replace(temp_path, self.index_path)
+
+    @contextmanager
+    def _lock_index(self, timeout=10.0):
+        # An exclusively created lock file works the same on every platform;
+        # one left by a killed process is taken over after the timeout
+        while True:
+            try:
+                lock_file = os.open(self.lock_path, os.O_CREAT | os.O_EXCL)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) > timeout:
+                        os.remove(self.lock_path)
+                        continue
+                except OSError:
+                    continue
+                time.sleep(0.005)
+
+        try:
+            yield
+        finally:
+            os.close(lock_file)
+            os.remove(self.lock_path)
@@ -1,9 +1,25 @@
-import struct
-import pyaudio
-import librosa
+import time
 import threading
 import numpy as np
-from pedalboard import Pedalboard, Reverb
+from functools import partial
+from BackgroundTrack import BackgroundTrack
+from TrackCache import TrackCache
+from Playlist import Playlist
+from BackgroundReverbCache import BackgroundReverbCache
+from ConvolutionReverb import ConvolutionReverb
+from EffectChain import EffectChain, DEFAULT_PRESET, load_preset
+from ParameterStore import ParameterStore, SmoothedValue
+from InputStage import InputStage
+from OutputStage import OutputStage
+from AudioBackend import PyAudioBackend, create_converter
+from Telemetry import Telemetry
+from Soundboard import Soundboard
+from RecordingTap import RecordingTap
+from StreamResampler import StreamResampler
+
+# PortAudio callback status flags
+INPUT_OVERFLOW = 0x2
+OUTPUT_UNDERFLOW = 0x4
 
 
 class VirtualMicroDevice:
@@ -14,276 +30,1044 @@ class VirtualMicroDevice:
         second_output_device_index,
         background_audio_file=None,
         sample_rate=44100,
+        block_size=256,
+        latency=0.02,
+        callback_mode_enabled=True,
+        audio_backend=None,
+        channels=1,
+        input_sample_rate=None,
+        output_sample_rate=None,
+        second_output_sample_rate=None,
     ):
-        # basic audio device parameters
+        # basic audio device parameters, the engine runs at sample_rate and
+        # devices at other rates are resampled at the device edges
         self.sample_rate = sample_rate
-        self.chunk_size = sample_rate
 
-        # initialize device indices
-        self.input_device_index = input_device_index
-        self.output_device_index = output_device_index
-        self.second_output_device_index = second_output_device_index
+        # output and background channels, the voice is captured in mono
+        self.channels = max(1, min(channels, 2))
+        self.block_size = 256
+        self.chunk_size = self.block_size
+        self.set_block_size(block_size)
 
-        # initialize audio devices
-        self.audio_input = None
-        self.audio_output_1 = None
-        self.audio_output_2 = None
+        # streaming mode: callback streams or the blocking read/write loop
+        self.callback_mode_enabled = callback_mode_enabled
 
-        # translation settings
-        self.second_output_device_enabled = False
+        # target latency of the output queues (seconds)
+        self.latency = 0.02
+        self.set_latency(latency)
 
-        self.translate_sound_to_first_device_flag = False
-        self.translate_sound_to_second_device_flag = False
+        # extra blocks an output may fall behind before its blocks are dropped
+        self.jitter_buffer_depth = 4
+
+        # audio streams, PyAudio is the default backend and PortAudio is only
+        # needed once started
+        self.audio_backend = audio_backend
 
         # audio effects
         self.noise_threshold = 0
 
+        # spectral noise suppression with a learned noise profile, one
+        # denoiser per input
+        self.denoiser_enabled = False
+        self.denoiser_strength = 1.0
+
+        # convolution with a room or cabinet impulse response, one
+        # convolver per input
+        self.convolution_enabled = False
+        self.convolution_mix = 0.5
+        self.impulse_response = None
+
         self.reverb_enabled = False
         self.audio_reverb_enabled = False
         self.reverb_room_size = 0.25
-        self.reverb_pedalboard = Pedalboard([Reverb(room_size=self.reverb_room_size)])
 
-        # settings for background audio
-        self.play_audio_on_first_device_flag = False
-        self.play_audio_on_second_device_flag = False
+        # the background reverb is created on first use and then updated in
+        # place, voice reverbs are part of the effect chain
+        self.audio_reverb = None
+        self.audio_reverb_pedalboard = None
 
+        # settings for background audio, tracks are normalized to their peak
+        # and mixed at about -12 dBFS at volume 1
+        self.background_audio_level = 0.25
         self.background_audio_volume = 0
         self.background_audio_position = 0
 
-        self.current_loop_iteration = 0
-        self.total_iterations = 1
+        # parameters the audio thread reads as one snapshot per block
+        self.parameters = ParameterStore(
+            noise_threshold=self.noise_threshold,
+            denoiser_enabled=self.denoiser_enabled,
+            denoiser_strength=self.denoiser_strength,
+            convolution_enabled=self.convolution_enabled,
+            convolution_mix=self.convolution_mix,
+            reverb_enabled=self.reverb_enabled,
+            audio_reverb_enabled=self.audio_reverb_enabled,
+            reverb_room_size=self.reverb_room_size,
+            background_audio_volume=self.background_audio_volume,
+            routing_matrix=np.zeros((0, 2), dtype=np.float32),
+        )
+
+        # continuous parameters change through per-block ramps
+        self.noise_threshold_smoother = SmoothedValue(self.noise_threshold)
+        self.background_audio_volume_smoother = SmoothedValue(
+            self.background_audio_volume
+        )
+        self.reverb_room_size_smoother = SmoothedValue(
+            self.reverb_room_size, max_step=0.02
+        )
+
+        # voice effects in the order of the preset, runs of pedalboard plugins
+        # are compiled into one Pedalboard per input
+        self.effect_chain = EffectChain(DEFAULT_PRESET, self.sample_rate)
+
+        # decoded and resampled tracks, cached on disk
+        self.track_cache = TrackCache()
+
+        # queued background tracks, played gaplessly with crossfades
+        self.playlist = Playlist(sample_rate=self.sample_rate, channels=self.channels)
+        self.background_audio_files = []
 
-        self.background_audio = None
+        # the looping background rendered with its reverb, played instead of
+        # the live reverb once ready
+        self.background_reverb_cache = BackgroundReverbCache(
+            self.sample_rate, self.channels, self.track_cache
+        )
+
+        self.background_track = None
         if background_audio_file:
             self.load_background_audio(background_audio_file)
 
+        # one-shot clips triggered by hotkeys or the control API
+        self.soundboard = Soundboard(self.sample_rate, self.channels, self.block_size)
+
         # the main thread
         self.is_running = False
         self.thread = None
 
+        # startup timing, see get_time_to_first_audio()
+        self.start_time = None
+        self.first_audio_time = None
+
+        # per-stage timings, xruns and swallowed exceptions
+        self.telemetry = Telemetry(self.sample_rate)
+
+        # inputs and outputs, the first input drives the processing; every
+        # output mixes the inputs and the background with its own gains
+        self.input_stages = []
+        self.output_stages = []
+        self.mix_buffer = np.zeros((0, 0), dtype=np.float32)
+
+        self.add_input_device(input_device_index, input_sample_rate)
+        self.add_output_device(output_device_index, output_sample_rate)
+        self.add_output_device(second_output_device_index, second_output_sample_rate)
+
+        # the second output is optional
+        self.set_second_output_device_enabled(False)
+
     # ----------------------------------------------------------------
+    def add_input_device(self, index, sample_rate=None):
+        # Returns the input number, used as a routing matrix column
+        input_stage = InputStage(
+            str(len(self.input_stages) + 1),
+            index,
+            sample_rate,
+            self.block_size,
+            self.sample_rate,
+        )
+        if self.impulse_response is not None:
+            self._create_convolution_reverb(input_stage)
+
+        self.input_stages.append(input_stage)
+        self._prepare_effect_chain(self.effect_chain)
+
+        # The background and the soundboard are the last columns
+        routing_matrix = self.get_routing_matrix()
+        self._set_routing_matrix(
+            np.insert(routing_matrix, routing_matrix.shape[1] - 2, 0, axis=1)
+        )
+
+        return len(self.input_stages) - 1
+
+    def add_output_device(self, index, sample_rate=None):
+        # Returns the output number, used as a routing matrix row
+        output_stage = OutputStage(
+            str(len(self.output_stages) + 1),
+            index,
+            sample_rate,
+            self.block_size,
+            self.channels,
+            self.sample_rate,
+            self.telemetry,
+        )
+
+        # created once, so a restarted stream matches its idle stream
+        output_stage.stream_callback = partial(self._output_callback, output_stage)
+
+        self.output_stages.append(output_stage)
+
+        routing_matrix = self.get_routing_matrix()
+        self._set_routing_matrix(
+            np.vstack([routing_matrix, np.zeros((1, routing_matrix.shape[1]))])
+        )
+
+        return len(self.output_stages) - 1
+
     def set_input_device_index(self, index):
-        self.input_device_index = index
+        self.input_stages[0].device_index = index
 
     def set_output_device_index(self, index):
-        self.output_device_index = index
+        self.output_stages[0].device_index = index
 
     def set_second_output_device_index(self, index):
-        self.second_output_device_index = index
+        self.output_stages[1].device_index = index
 
     def set_second_output_device_enabled(self, flag):
-        self.second_output_device_enabled = flag
+        self.set_output_enabled(1, flag)
+
+    def set_output_enabled(self, output, flag):
+        self.output_stages[output].enabled = flag
+
+    def set_block_size(self, block_size):
+        block_size = max(64, block_size)
+        block_size = min(block_size, 1024)
+        self.block_size = block_size
+        self.chunk_size = block_size
+
+        # Impulse responses are partitioned for the new size here, never in
+        # the audio thread (no inputs yet while the device is created)
+        for input_stage in getattr(self, "input_stages", []):
+            if input_stage.convolution_reverb is not None:
+                input_stage.convolution_reverb.reset(block_size)
+
+    def set_latency(self, latency):
+        latency = max(0.001, latency)
+        latency = min(latency, 1.0)
+        self.latency = latency
+
+    def set_input_sample_rate(self, rate):
+        self.input_stages[0].sample_rate = rate
+
+    def set_output_sample_rate(self, rate):
+        self.output_stages[0].sample_rate = rate
+
+    def set_second_output_sample_rate(self, rate):
+        self.output_stages[1].sample_rate = rate
+
+    def set_callback_mode_enabled(self, flag):
+        self.callback_mode_enabled = flag
+
+    def set_jitter_buffer_depth(self, depth):
+        depth = max(1, depth)
+        depth = min(depth, 32)
+        self.jitter_buffer_depth = depth
+
+    def get_stream_latency(self):
+        queue_latency = self._get_queue_depth() * self.block_size / self.sample_rate
+        if not self.callback_mode_enabled:
+            # only the silent block that pads resampled outputs
+            queue_latency = 0
+            if self._is_resampling():
+                queue_latency = self.block_size / self.sample_rate
+
+        denoiser_latency = 0
+        if self.denoiser_enabled:
+            denoiser_latency = self.input_stages[0].denoiser.latency
+
+        # group delay of the resampling filters on the main path
+        resampler_latency = 0
+        for resampler in [
+            self.input_stages[0].resampler,
+            self.output_stages[0].resampler,
+        ]:
+            if resampler is not None:
+                resampler_latency += resampler.delay
+
+        input_latency = self.input_stages[0].latency
+        output_latencies = [
+            output_stage.latency for output_stage in self.get_output_stages()
+        ]
+
+        return {
+            "input": input_latency,
+            "outputs": output_latencies,
+            "queue": queue_latency,
+            "resampler": resampler_latency,
+            "denoiser": denoiser_latency,
+            "total": input_latency
+            + queue_latency
+            + resampler_latency
+            + denoiser_latency
+            + self.output_stages[0].latency,
+        }
 
     # ----------------------------------------------------------------
-    def set_translate_sound_to_first_device_flag(self, flag):
-        self.translate_sound_to_first_device_flag = flag
+    def set_routing_matrix(self, routing_matrix):
+        # Gains of every output (rows) for every input, the background and
+        # the soundboard (columns), 1 routes a signal unchanged and 0 mutes it
+        routing_matrix = np.clip(np.array(routing_matrix, dtype=np.float32), 0, 2)
+
+        shape = (len(self.output_stages), len(self.input_stages) + 2)
+        if routing_matrix.shape != shape:
+            raise ValueError(f"Routing matrix must be {shape[0]}x{shape[1]}")
+
+        self._set_routing_matrix(routing_matrix)
+
+    def get_routing_matrix(self):
+        return self.parameters.get("routing_matrix").copy()
+
+    def set_voice_gain(self, output, input, gain):
+        self._set_routing_gain(output, input, gain)
+
+    def set_background_gain(self, output, gain):
+        self._set_routing_gain(output, len(self.input_stages), gain)
+
+    def set_soundboard_gain(self, output, gain):
+        self._set_routing_gain(output, len(self.input_stages) + 1, gain)
+
+    def _set_routing_gain(self, output, column, gain):
+        routing_matrix = self.get_routing_matrix()
+        routing_matrix[output, column] = gain
+        self.set_routing_matrix(routing_matrix)
 
-    def set_translate_sound_to_second_device_flag(self, flag):
-        self.translate_sound_to_second_device_flag = flag
+    def _set_routing_matrix(self, routing_matrix):
+        # A new array on every change, the audio thread keeps its snapshot
+        routing_matrix = routing_matrix.astype(np.float32)
+        routing_matrix.setflags(write=False)
+        self.parameters.set("routing_matrix", routing_matrix)
 
+    # ----------------------------------------------------------------
     def set_noise_threshold(self, threshold):
         threshold = max(0, threshold)
-        threshold = min(threshold, 3000)
+        threshold = min(threshold, 0.1)
         self.noise_threshold = threshold
+        self.parameters.set("noise_threshold", threshold)
+
+    def set_denoiser_enabled(self, flag):
+        self.denoiser_enabled = flag
+        self.parameters.set("denoiser_enabled", flag)
+
+    def set_denoiser_strength(self, strength):
+        strength = max(0, strength)
+        strength = min(strength, 1)
+        self.denoiser_strength = strength
+        self.parameters.set("denoiser_strength", strength)
+
+    def learn_noise(self, duration=1.0):
+        # The next second of voice input should be background noise only
+        duration = max(0.1, duration)
+        duration = min(duration, 10.0)
+        for input_stage in self.input_stages:
+            input_stage.denoiser.learn_noise(duration)
+
+    def is_learning_noise(self):
+        return any(
+            input_stage.denoiser.is_learning() for input_stage in self.input_stages
+        )
+
+    def load_impulse_response(self, file_path):
+        # Decoded like the background tracks, resampled to the engine rate
+        self.impulse_response = np.array(self._decode_audio_file(file_path, True))
+
+        for input_stage in self.input_stages:
+            self._create_convolution_reverb(input_stage)
+
+    def _create_convolution_reverb(self, input_stage):
+        # The impulse response spectra are computed here, not in the audio thread
+        input_stage.convolution_reverb = ConvolutionReverb(
+            self.impulse_response, self.sample_rate, self.block_size
+        )
+        input_stage.convolution_active = False
+
+    def set_convolution_enabled(self, flag):
+        self.convolution_enabled = flag
+        self.parameters.set("convolution_enabled", flag)
+
+    def set_convolution_mix(self, mix):
+        mix = max(0, mix)
+        mix = min(mix, 1)
+        self.convolution_mix = mix
+        self.parameters.set("convolution_mix", mix)
 
     def set_reverb_enabled(self, flag):
+        # Plugins the flag switches on are created before the audio thread
+        # sees it
+        self._prepare_effect_chain(self.effect_chain, reverb_enabled=flag)
         self.reverb_enabled = flag
+        self.parameters.set("reverb_enabled", flag)
 
     def set_audio_reverb_enabled(self, flag):
+        if flag:
+            self._load_reverb()
         self.audio_reverb_enabled = flag
+        self.parameters.set("audio_reverb_enabled", flag)
+        self._update_background_reverb_cache()
+
+    def _load_reverb(self):
+        if self.audio_reverb_pedalboard is not None:
+            return
+
+        # pedalboard is slow to import, load it only when reverb is used
+        from pedalboard import Pedalboard, Reverb
+
+        self.audio_reverb = Reverb(room_size=self.reverb_room_size_smoother.value)
+        self.audio_reverb_pedalboard = Pedalboard([self.audio_reverb])
+
+    # ----------------------------------------------------------------
+    def set_effect_preset(self, preset):
+        # A new chain with new plugins, swapped in as a whole
+        effect_chain = EffectChain(preset, self.sample_rate)
+        self._prepare_effect_chain(effect_chain)
+        self.effect_chain = effect_chain
+
+    def load_effect_preset(self, name):
+        # A preset from the presets directory or a JSON file
+        self.set_effect_preset(load_preset(name))
+
+    def get_effect_preset_name(self):
+        return self.effect_chain.name
+
+    def _prepare_effect_chain(self, effect_chain, **changes):
+        parameters = dict(self.parameters.get_snapshot(), **changes)
+        parameters["reverb_room_size"] = self.reverb_room_size_smoother.value
+        effect_chain.prepare(parameters, len(self.input_stages))
 
     def set_reverb_room_size(self, room_size):
         room_size = max(0, room_size)
         room_size = min(room_size, 1)
         self.reverb_room_size = room_size
-        self.reverb_pedalboard = Pedalboard([Reverb(room_size=self.reverb_room_size)])
+        self.parameters.set("reverb_room_size", room_size)
+        self._update_background_reverb_cache()
+
+    def set_reverb_cache_memory_budget(self, memory_budget):
+        # 0 keeps the background reverb live
+        memory_budget = max(0, memory_budget)
+        self.background_reverb_cache.set_memory_budget(int(memory_budget))
+
+    def _update_background_reverb_cache(self):
+        if self.audio_reverb_enabled:
+            self.background_reverb_cache.update(
+                self.playlist,
+                self.background_audio_files,
+                self.background_audio_level,
+                self.reverb_room_size,
+            )
 
     # ----------------------------------------------------------------
-    def load_background_audio(self, file_path):
-        audio_data, _ = librosa.load(file_path, sr=self.sample_rate, mono=True)
-        self.background_audio = np.array(audio_data, dtype=np.float32)
+    def load_background_audio(self, file_path, streaming=True):
+        background_track = self._create_background_track(file_path, streaming)
+
+        self.playlist.clear()
+        self.playlist.add_track(background_track)
+        self.background_audio_files = [file_path]
+        self.background_track = self.playlist
+        self._update_background_reverb_cache()
+
+    def add_background_audio(self, file_path, streaming=True):
+        self.playlist.add_track(self._create_background_track(file_path, streaming))
+        self.background_audio_files.append(file_path)
+        self.background_track = self.playlist
+        self._update_background_reverb_cache()
+
+    def set_crossfade_duration(self, duration):
+        duration = max(0, duration)
+        duration = min(duration, 10.0)
+        self.playlist.set_crossfade_duration(duration)
+        self._update_background_reverb_cache()
+
+    def _create_background_track(self, file_path, streaming=True):
+        mono = self.channels == 1
+        cached_audio = self.track_cache.load(file_path, self.sample_rate, mono)
+
+        if cached_audio is not None:
+            audio_data, audio_koeff = cached_audio
+            return BackgroundTrack(audio_data, audio_koeff, self.channels)
+
+        if streaming:
+            try:
+                from StreamingBackgroundTrack import StreamingBackgroundTrack
 
-        self.current_loop_iteration = 0
-        self.total_iterations = len(self.background_audio) // self.chunk_size
+                # Decode and resample in blocks while playing
+                background_track = StreamingBackgroundTrack(
+                    file_path, self.sample_rate, self.channels
+                )
+                self.track_cache.store_async(
+                    file_path,
+                    self.sample_rate,
+                    mono,
+                    on_stored=background_track.set_peak,
+                )
+                return background_track
+            except RuntimeError:
+                pass
+
+        audio_data = self._decode_audio_file(file_path, mono)
+        return BackgroundTrack(audio_data, channels=self.channels)
 
-    def set_play_audio_on_first_device_flag(self, flag):
-        self.play_audio_on_first_device_flag = flag
+    def _decode_audio_file(self, file_path, mono=True):
+        cached_audio = self.track_cache.load(file_path, self.sample_rate, mono)
+        if cached_audio is not None:
+            return cached_audio[0]
 
-    def set_play_audio_on_second_device_flag(self, flag):
-        self.play_audio_on_second_device_flag = flag
+        # Formats libsndfile can't read are decoded at once by librosa,
+        # as are tracks for the offline renderer
+        import librosa
+
+        audio_data, _ = librosa.load(file_path, sr=self.sample_rate, mono=mono)
+        if audio_data.ndim > 1:
+            # librosa returns (channels, frames), tracks are stored by frame
+            audio_data = np.ascontiguousarray(audio_data.T)
+
+        self.track_cache.store_async(
+            file_path, self.sample_rate, mono, audio_data=audio_data
+        )
+
+        return audio_data
 
     def set_background_audio_volume(self, volume):
         volume = max(0, volume)
         volume = min(volume, 3.0)
         self.background_audio_volume = volume
+        self.parameters.set("background_audio_volume", volume)
 
     def set_background_audio_position(self, position):
         position = max(0, position)
         position = min(position, 100)
         self.background_audio_position = position
 
-        if self.background_audio is not None:
-            self.current_loop_iteration = int(
-                self.total_iterations * (self.background_audio_position / 100)
-            )
+        if self.background_track is not None:
+            self.background_track.set_position_percent(position)
 
     def get_background_audio_position(self):
-        if self.background_audio is not None:
-            return (self.current_loop_iteration / self.total_iterations) * 100
+        if self.background_track is not None:
+            return self.background_track.get_position_percent()
         else:
             return 0
 
+    def get_background_track_count(self):
+        return self.playlist.get_track_count()
+
+    def get_background_audio_time(self):
+        # Sample-accurate playback position and length, in seconds
+        if self.background_track is not None:
+            return (
+                self.background_track.position / self.sample_rate,
+                self.background_track.length / self.sample_rate,
+            )
+        else:
+            return (0, 0)
+
+    # ----------------------------------------------------------------
+    def load_clip(self, name, file_path):
+        self.soundboard.load_clip(name, file_path)
+
+    def remove_clip(self, name):
+        self.soundboard.remove_clip(name)
+
+    def trigger_clip(self, name, gain=1.0):
+        # Mixed in from the next block on, routed by the soundboard gains
+        self.soundboard.trigger(name, gain)
+
+    def stop_clips(self):
+        self.soundboard.stop()
+
+    def set_soundboard_memory_budget(self, memory_budget):
+        memory_budget = max(1024**2, memory_budget)
+        self.soundboard.set_memory_budget(int(memory_budget))
+
+    # ----------------------------------------------------------------
+    def start_recording(
+        self,
+        directory,
+        output=0,
+        file_format="wav",
+        max_file_seconds=None,
+        max_file_bytes=None,
+    ):
+        # Archives what goes out on an output, written by a background thread
+        self.stop_recording(output)
+
+        output_stage = self.output_stages[output]
+        recording_tap = RecordingTap(
+            directory,
+            self.sample_rate,
+            self.channels,
+            self.block_size,
+            file_format,
+            max_file_seconds,
+            max_file_bytes,
+            name=f"output-{output_stage.name}",
+        )
+        recording_tap.start()
+        output_stage.recording_tap = recording_tap
+
+    def stop_recording(self, output=0):
+        output_stage = self.output_stages[output]
+        recording_tap = output_stage.recording_tap
+
+        if recording_tap is not None:
+            output_stage.recording_tap = None
+            recording_tap.stop()
+
+    def is_recording(self, output=0):
+        return self.output_stages[output].recording_tap is not None
+
     # ----------------------------------------------------------------
     def reduce_noise(self, data, noise_gate_threshold):
         reduced_noise_data = np.where(np.abs(data) <= noise_gate_threshold, 0, data)
         return reduced_noise_data
 
-    def increment_audio_position(self):
-        self.current_loop_iteration = (
-            self.current_loop_iteration + 1
-        ) % self.total_iterations
+    def increment_audio_position(self, background_track, frame_count):
+        background_track.advance(frame_count)
 
-    def get_normalized_audio_data(self, data, background_audio):
-        # Get current audio position
-        loop_length = len(background_audio)
-        current_pos = self.chunk_size * self.current_loop_iteration % loop_length
+    def _update_reverb_room_size(self, room_size):
+        previous_room_size = self.reverb_room_size_smoother.value
+        room_size = self.reverb_room_size_smoother.next_value(room_size)
 
-        # Normalize background audio data
-        audio_koeff = np.max(np.abs(background_audio))
-        background_audio_normalized = self.background_audio / audio_koeff
+        if room_size != previous_room_size and self.audio_reverb is not None:
+            self.audio_reverb.room_size = room_size
 
-        background_audio_data = np.zeros(len(data))
-        for i in range(len(data)):
-            background_audio_data[i] = background_audio_normalized[
-                current_pos % loop_length
+    def get_output_stages(self):
+        return [
+            output_stage for output_stage in self.output_stages if output_stage.enabled
+        ]
+
+    def _get_output_gains(self, routing_matrix):
+        # Rows of the enabled outputs
+        return routing_matrix[
+            [
+                i
+                for i, output_stage in enumerate(self.output_stages)
+                if output_stage.enabled
             ]
-            current_pos += 1
+        ]
+
+    def process_audio(self, data):
+        telemetry = self.telemetry
+        start_time = time.perf_counter()
+
+        # A block of the first input, or a list with a block of every input;
+        # binary data is converted to floats, resampled input arrives
+        # already converted
+        if not isinstance(data, list):
+            data = [data]
+        input_data = [
+            input_stage.converter.decode(block) if isinstance(block, bytes) else block
+            for input_stage, block in zip(self.input_stages, data)
+        ]
+        frame_count = len(input_data[0])
+        output_stages = self.get_output_stages()
+
+        # One consistent view of the UI parameters for the whole block
+        parameters = self.parameters.get_snapshot()
+        self._update_reverb_room_size(parameters["reverb_room_size"])
+
+        # Only the sources some output hears are processed
+        gains = self._get_output_gains(parameters["routing_matrix"])
+        sources = np.flatnonzero(np.any(gains, axis=0))
+        background_index = len(self.input_stages)
+        voice_inputs = sources[sources < background_index]
+        start_time = telemetry.record("decode", start_time)
+
+        # Voice path, processed once for all outputs
+        voice_data = None
+        if len(voice_inputs):
+            voice_data = np.zeros((len(voice_inputs), frame_count), dtype=np.float32)
+            for i, input_index in enumerate(voice_inputs):
+                if input_index < len(input_data):
+                    voice_data[i] = input_data[input_index]
+
+            # Effects in the order of the preset, the bound plugin parameters
+            # follow the smoothed values
+            segments = self.effect_chain.get_segments(
+                parameters, {"reverb_room_size": self.reverb_room_size_smoother.value}
+            )
+            for stage, boards in segments:
+                if boards is not None:
+                    # One Pedalboard call per input for a run of plugins
+                    for i, input_index in enumerate(voice_inputs):
+                        voice_data[i] = boards[input_index](
+                            voice_data[i], self.sample_rate, reset=False
+                        )
+                    start_time = telemetry.record(stage, start_time)
+                elif self._apply_voice_stage(
+                    stage, voice_inputs, voice_data, parameters
+                ):
+                    start_time = telemetry.record(stage, start_time)
+
+        # Shared background audio path
+        # Read once, the control thread may replace it at any time
+        background_track = self.background_track
+        audio_data = None
+        if background_track is not None and background_index in sources:
+            rendered_track = None
+            if parameters["audio_reverb_enabled"]:
+                rendered_track = self.background_reverb_cache.get_track(
+                    self.playlist.layout, parameters["reverb_room_size"]
+                )
 
-        # Change background audio volume
-        background_audio_data *= self.background_audio_volume
+            if rendered_track is not None:
+                # Rendered with the reverb, the tail wraps across the loop point
+                rendered_track.seek(background_track.position)
+                audio_data = rendered_track.read(frame_count)
+            else:
+                audio_data = background_track.read(
+                    frame_count, self.background_audio_level
+                )
+            audio_data *= self.background_audio_volume_smoother.next_block(
+                parameters["background_audio_volume"], frame_count
+            )
+            start_time = telemetry.record("background", start_time)
 
-        return background_audio_data
+            if rendered_track is None and parameters["audio_reverb_enabled"]:
+                audio_data = self.audio_reverb_pedalboard(
+                    audio_data, self.sample_rate, reset=False
+                )
+                start_time = telemetry.record("audio_reverb", start_time)
+
+        # One-shot clips, started at this block
+        clip_data = None
+        if background_index + 1 in sources:
+            clip_data = self.soundboard.read(frame_count)
+            start_time = telemetry.record("soundboard", start_time)
+
+        # Routing: one matrix multiply mixes every output
+        source_data = list(voice_data if voice_data is not None else [])
+        if background_index in sources:
+            source_data.append(audio_data)
+        if background_index + 1 in sources:
+            source_data.append(clip_data)
+
+        mixed_data = self._mix(gains[:, sources], source_data, frame_count)
+        processed_data = [
+            output_stage.process(output_data)
+            for output_stage, output_data in zip(output_stages, mixed_data)
+        ]
+        telemetry.record("mix", start_time)
 
-    def process_audio_for_device_1(self, data):
-        # Convert binary data to numpy array of floats
-        data = np.array(struct.unpack(f"{len(data)//2}h", data), dtype=np.float32)
+        return processed_data
 
-        processed_data: np.ndarray
-        if not self.translate_sound_to_first_device_flag:
-            processed_data = np.zeros_like(data)
-        else:
-            # Reduce noise
-            processed_data = self.reduce_noise(data, self.noise_threshold)
+    def _apply_voice_stage(self, stage, voice_inputs, voice_data, parameters):
+        if stage == "denoiser":
+            # Spectral noise suppression, also run while learning the profile
+            return self._apply_denoiser(voice_inputs, voice_data, parameters)
 
-            # Add reverberation effect
-            if self.reverb_enabled:
-                processed_data = self.reverb_pedalboard(
-                    processed_data, self.sample_rate, reset=False
-                )
+        if stage == "noise_gate":
+            # Reduce noise, the gate works on every input at once
+            noise_threshold = self.noise_threshold_smoother.next_block(
+                parameters["noise_threshold"], voice_data.shape[1]
+            )
+            voice_data[:] = self.reduce_noise(voice_data, noise_threshold)
+            return True
+
+        if stage == "convolution":
+            # Room or cabinet impulse response
+            return self._apply_convolution(voice_inputs, voice_data, parameters)
 
-        # Add background audio
-        if self.play_audio_on_first_device_flag:
-            if self.background_audio is not None:
-                default_audio_volume = 8000
-                audio_data = self.get_normalized_audio_data(
-                    processed_data, self.background_audio
+        return False
+
+    def _apply_denoiser(self, voice_inputs, voice_data, parameters):
+        denoiser_enabled = parameters["denoiser_enabled"]
+        is_applied = False
+
+        for i, input_index in enumerate(voice_inputs):
+            input_stage = self.input_stages[input_index]
+            denoiser = input_stage.denoiser
+
+            if denoiser_enabled and not input_stage.denoiser_active:
+                # Audio left from the last time it was enabled is stale
+                denoiser.reset()
+            input_stage.denoiser_active = denoiser_enabled
+
+            if denoiser_enabled or denoiser.is_learning():
+                denoised_data = denoiser.process(
+                    voice_data[i], parameters["denoiser_strength"]
+                )
+                if denoiser_enabled:
+                    voice_data[i] = denoised_data
+                is_applied = True
+
+        return is_applied
+
+    def _apply_convolution(self, voice_inputs, voice_data, parameters):
+        convolution_enabled = parameters["convolution_enabled"]
+        is_applied = False
+
+        for i, input_index in enumerate(voice_inputs):
+            input_stage = self.input_stages[input_index]
+            convolution_reverb = input_stage.convolution_reverb
+            if convolution_reverb is None:
+                continue
+
+            if convolution_enabled and not input_stage.convolution_active:
+                # The tail left from the last time it was enabled is stale
+                convolution_reverb.reset()
+            input_stage.convolution_active = convolution_enabled
+
+            if convolution_enabled:
+                voice_data[i] = convolution_reverb.process(
+                    voice_data[i], parameters["convolution_mix"]
                 )
-                audio_data *= default_audio_volume
+                is_applied = True
 
-                if self.audio_reverb_enabled:
-                    audio_data = self.reverb_pedalboard(
-                        audio_data, self.sample_rate, reset=False
-                    )
+        return is_applied
 
-                processed_data += audio_data
+    def _mix(self, gains, source_data, frame_count):
+        source_count = len(source_data)
+        size = self.channels * frame_count
 
-        # Convert back to binary data
-        processed_data = struct.pack(
-            f"{len(processed_data)}h", *np.array(processed_data, dtype=np.int16)
-        )
+        if self.mix_buffer.shape != (source_count, size):
+            self.mix_buffer = np.zeros((source_count, size), dtype=np.float32)
 
-        return processed_data
+        # Sources as rows of planar (channels, frames) data, the mono voice is
+        # sent to every channel and silent sources are None
+        mix_buffer = self.mix_buffer.reshape(source_count, self.channels, -1)
+        for i, data in enumerate(source_data):
+            if data is None:
+                mix_buffer[i] = 0
+            else:
+                mix_buffer[i] = data
+
+        mixed_data = gains @ self.mix_buffer
+        return mixed_data.reshape(len(gains), self.channels, -1)
+
+    # ----------------------------------------------------------------
+    def run(self):
+        if self.audio_backend is None:
+            self.audio_backend = PyAudioBackend()
 
-    def process_audio_for_device_2(self, data):
-        # Convert binary data to numpy array of floats
-        data = np.array(struct.unpack(f"{len(data)//2}h", data), dtype=np.float32)
+        self._prepare_streams()
 
-        processed_data: np.ndarray
-        if not self.translate_sound_to_second_device_flag:
-            processed_data = np.zeros_like(data)
+        if self.callback_mode_enabled:
+            self._run_callback()
         else:
-            # Reduce noise
-            processed_data = self.reduce_noise(data, self.noise_threshold)
+            self._run_blocking()
+
+    def _run_blocking(self):
+        # Resampled blocks don't line up with the device buffers, one block
+        # of silence keeps the outputs from running dry between them
+        prefill = 0
+        if self._is_resampling():
+            prefill = 1
+
+        self._reset_output_writers(self.jitter_buffer_depth, prefill)
+        self._reset_inputs(self.jitter_buffer_depth)
+
+        self._start_inputs()
+        self._start_outputs()
+
+        # Every output is written and every other input is read from its own
+        # thread, so a stalled device never delays capture
+        output_stages = self.get_output_stages()
+        for output_stage in output_stages:
+            output_stage.writer.start(output_stage.stream)
+
+        for input_stage in self.input_stages[1:]:
+            input_stage.start(
+                input_stage.stream, self._get_device_block_size(input_stage.sample_rate)
+            )
 
-            # Add reverberation effect
-            if self.reverb_enabled:
-                processed_data = self.reverb_pedalboard(
-                    processed_data, self.sample_rate, reset=False
-                )
+        self._update_stream_latency()
+        self.is_running = True
 
-        # Add background audio
-        if self.play_audio_on_second_device_flag:
-            if self.background_audio is not None:
-                default_audio_volume = 8000
-                audio_data = self.get_normalized_audio_data(
-                    processed_data, self.background_audio
-                )
-                audio_data *= default_audio_volume
+        audio_input = self.input_stages[0].stream
+        input_block_size = self._get_device_block_size(self.input_stages[0].sample_rate)
 
-                if self.audio_reverb_enabled:
-                    audio_data = self.reverb_pedalboard(
-                        audio_data, self.sample_rate, reset=False
-                    )
+        while self.is_running:
+            try:
+                data = audio_input.read(input_block_size)
+            except OSError:
+                # Input overflow, samples were lost while the loop was busy
+                self.telemetry.count("input_overflows")
+                data = audio_input.read(input_block_size, exception_on_overflow=False)
 
-                processed_data += audio_data
+            for block, frame_count in self._read_input_blocks(data, input_block_size):
+                processed_data = self.process_block(block, frame_count)
 
-        # Convert back to binary data
-        processed_data = struct.pack(
-            f"{len(processed_data)}h", *np.array(processed_data, dtype=np.int16)
-        )
+                for output_stage, output_data in zip(output_stages, processed_data):
+                    output_stage.writer.push(output_data)
 
-        return processed_data
+        for output_stage in output_stages:
+            output_stage.writer.stop()
 
-    # ----------------------------------------------------------------
-    def run(self):
-        self._start_input()
-        self._start_output_1()
+        self._stop_inputs()
+        self._stop_outputs()
+
+        for input_stage in self.input_stages[1:]:
+            input_stage.stop()
+
+    def _run_callback(self):
+        # Prefill the output buffers with silence to absorb clock jitter
+        queue_depth = self._get_queue_depth()
 
-        if self.second_output_device_enabled:
-            self._start_output_2()
+        self._reset_output_writers(queue_depth + self.jitter_buffer_depth, queue_depth)
+        self._reset_inputs(queue_depth + self.jitter_buffer_depth)
 
+        self._start_outputs(callback_mode=True)
+        self._start_inputs(callback_mode=True)
+
+        self._update_stream_latency()
         self.is_running = True
 
+        # Audio is processed on the PortAudio thread, just wait for stop()
         while self.is_running:
-            data = self.audio_input.read(self.chunk_size)
+            time.sleep(0.05)
+
+        self._stop_inputs()
+        self._stop_outputs()
+
+    def _input_callback(self, in_data, frame_count, time_info, status):
+        if status & INPUT_OVERFLOW:
+            self.telemetry.count("input_overflows")
+
+        output_stages = self.get_output_stages()
+
+        for block, block_frame_count in self._read_input_blocks(in_data, frame_count):
+            processed_data = self.process_block(block, block_frame_count)
+
+            for output_stage, output_data in zip(output_stages, processed_data):
+                output_stage.writer.push(output_data)
+
+        return None
+
+    def _read_input_blocks(self, data, frame_count):
+        input_stage = self.input_stages[0]
+        other_input_stages = self.input_stages[1:]
+
+        if input_stage.resampler is None:
+            if not other_input_stages:
+                yield data, frame_count
+            else:
+                # Other inputs run on their own clocks and are buffered
+                yield [data] + [
+                    other_input_stage.pop(frame_count)
+                    for other_input_stage in other_input_stages
+                ], frame_count
+            return
+
+        # Resampled input doesn't come in whole blocks, collect it first
+        input_stage.push(data)
+
+        while input_stage.get_available_count() >= self.block_size:
+            yield [
+                input_stage.pop(self.block_size) for input_stage in self.input_stages
+            ], self.block_size
+
+    def _output_callback(self, output_stage, in_data, frame_count, time_info, status):
+        if status & OUTPUT_UNDERFLOW:
+            output_stage.writer.count_underflow()
+
+        return output_stage.writer.pop(frame_count)
+
+    def _reset_output_writers(self, capacity, prefill=0):
+        for output_stage in self.get_output_stages():
+            output_stage.writer.reset(
+                self._get_device_block_size(output_stage.sample_rate),
+                self._get_device_rate(output_stage.sample_rate),
+                output_stage.converter.frame_size,
+                capacity,
+                prefill,
+            )
 
-            try:
-                processed_data_1 = self.process_audio_for_device_1(data)
-                self.audio_output_1.write(processed_data_1)
-            except:
-                pass
+    def _reset_inputs(self, capacity):
+        # The first input is drained right away, other inputs start with a
+        # block of silence against the phase of their clocks
+        for i, input_stage in enumerate(self.input_stages):
+            input_stage.reset(
+                self.block_size,
+                (capacity + 2) * self.block_size,
+                min(i, 1) * self.block_size,
+            )
+
+    def process_block(self, data, frame_count):
+        # One block of the live path, shared by both streaming modes and the
+        # offline renderer, so they produce identical output
+        start_time = time.perf_counter()
+
+        try:
+            processed_data = self.process_audio(data)
+        except Exception as error:
+            self.telemetry.record_exception("process_exceptions", error)
+            processed_data = []
+
+        self._mark_first_audio(processed_data)
+        self._advance_background_audio(frame_count)
+
+        self.telemetry.end_block(start_time, frame_count)
+
+        return processed_data
+
+    def _mark_first_audio(self, processed_data):
+        if self.first_audio_time is None and processed_data:
+            self.first_audio_time = time.perf_counter()
+
+    def get_time_to_first_audio(self):
+        if self.start_time is None or self.first_audio_time is None:
+            return None
+        return self.first_audio_time - self.start_time
+
+    def _advance_background_audio(self, frame_count):
+        # Read once, the control thread may replace it at any time
+        background_track = self.background_track
+        if background_track is None:
+            return
+
+        gains = self._get_output_gains(self.parameters.get("routing_matrix"))
+        if np.any(gains[:, len(self.input_stages)]):
+            # Update current audio position
+            self.increment_audio_position(background_track, frame_count)
+
+    def get_telemetry(self):
+        telemetry = self.telemetry.get_snapshot()
+        telemetry["latency"] = self.get_stream_latency()
+        telemetry["inputs"] = [
+            input_stage.get_stats() for input_stage in self.input_stages
+        ]
+        telemetry["outputs"] = [
+            output_stage.writer.get_stats() for output_stage in self.get_output_stages()
+        ]
+
+        # A triggered clip waits for the next block, then goes the output path
+        soundboard = self.soundboard.get_stats()
+        output_latency = telemetry["latency"]["queue"] + self.output_stages[0].latency
+        if self.output_stages[0].resampler is not None:
+            output_latency += self.output_stages[0].resampler.delay
+        soundboard["trigger_to_audio_latency"] = (
+            soundboard["trigger_latency_mean"] + output_latency
+        )
+        telemetry["soundboard"] = soundboard
 
-            if self.second_output_device_enabled:
-                try:
-                    processed_data_2 = self.process_audio_for_device_2(data)
-                    self.audio_output_2.write(processed_data_2)
-                except:
-                    pass
+        telemetry["background_reverb"] = self.background_reverb_cache.get_stats()
 
-            if self.play_audio_on_first_device_flag or (
-                self.play_audio_on_second_device_flag
-                and self.second_output_device_enabled
-            ):
-                # Update current audio position
-                self.increment_audio_position()
+        telemetry["recordings"] = [
+            output_stage.recording_tap.get_stats()
+            for output_stage in self.output_stages
+            if output_stage.recording_tap is not None
+        ]
 
-        self._stop_input()
-        self._stop_output_1()
+        return telemetry
 
-        if self.second_output_device_enabled:
-            self._stop_output_2()
+    def _get_queue_depth(self):
+        return max(1, round(self.latency * self.sample_rate / self.block_size))
+
+    def _update_stream_latency(self):
+        for input_stage in self.input_stages:
+            input_stage.latency = input_stage.stream.get_input_latency()
+
+        for output_stage in self.output_stages:
+            output_stage.latency = 0
+            if output_stage.enabled:
+                output_stage.latency = output_stage.stream.get_output_latency()
 
     def start(self):
+        self.start_time = time.perf_counter()
+        self.first_audio_time = None
+        self.telemetry.reset()
+
+        for input_stage in self.input_stages:
+            input_stage.reset_stats()
+
+        for output_stage in self.output_stages:
+            output_stage.writer.reset_stats()
+
         self.thread = threading.Thread(target=self.run)
         self.thread.start()
 
@@ -292,44 +1076,100 @@ class VirtualMicroDevice:
         self.thread.join()
 
     # ----------------------------------------------------------------
-    def _start_input(self):
-        self.audio_input = pyaudio.PyAudio().open(
-            format=pyaudio.paInt16,
-            channels=1,
-            rate=self.sample_rate,
-            input=True,
-            input_device_index=self.input_device_index,
-            frames_per_buffer=self.chunk_size,
-        )
+    def _prepare_streams(self):
+        # Native float32 where the device supports it, int16 otherwise;
+        # streaming resamplers at the device edges, the engine keeps one rate
+        for input_stage in self.input_stages:
+            input_rate = self._get_device_rate(input_stage.sample_rate)
+            input_stage.set_converter(
+                create_converter(
+                    self._get_sample_format(
+                        1,
+                        input_rate,
+                        input=True,
+                        input_device_index=input_stage.device_index,
+                    ),
+                    self.block_size,
+                )
+            )
+
+            input_stage.set_resampler(None)
+            if input_rate != self.sample_rate:
+                input_stage.set_resampler(StreamResampler(input_rate, self.sample_rate))
+
+        for output_stage in self.get_output_stages():
+            output_rate = self._get_device_rate(output_stage.sample_rate)
+            sample_format = self._get_sample_format(
+                self.channels,
+                output_rate,
+                output=True,
+                output_device_index=output_stage.device_index,
+            )
+            output_stage.set_converter(
+                create_converter(sample_format, self.block_size, self.channels)
+            )
+
+            output_stage.set_resampler(None)
+            if output_rate != self.sample_rate:
+                output_stage.set_resampler(
+                    StreamResampler(self.sample_rate, output_rate, self.channels)
+                )
+
+    def _get_sample_format(self, channels, rate, **device):
+        if self.audio_backend.is_format_supported("float32", rate, channels, **device):
+            return "float32"
+        return "int16"
 
-    def _start_output_1(self):
-        self.audio_output_1 = pyaudio.PyAudio().open(
-            format=pyaudio.paInt16,
-            channels=1,
-            rate=self.sample_rate,
-            output=True,
-            output_device_index=self.output_device_index,
-            frames_per_buffer=self.chunk_size,
+    def _is_resampling(self):
+        return any(
+            stage.resampler is not None
+            for stage in self.input_stages + self.get_output_stages()
         )
 
-    def _start_output_2(self):
-        self.audio_output_2 = pyaudio.PyAudio().open(
-            format=pyaudio.paInt16,
-            channels=1,
-            rate=self.sample_rate,
-            output=True,
-            output_device_index=self.second_output_device_index,
-            frames_per_buffer=self.chunk_size,
+    def _get_device_rate(self, rate):
+        return rate or self.sample_rate
+
+    def _get_device_block_size(self, rate):
+        # Device buffers last as long as one engine block
+        return max(
+            1, round(self.chunk_size * self._get_device_rate(rate) / self.sample_rate)
         )
 
-    def _stop_input(self):
-        self.audio_input.stop_stream()
-        self.audio_input.close()
+    def _start_inputs(self, callback_mode=False):
+        # The first input drives the processing, so it starts last
+        for input_stage in reversed(self.input_stages):
+            stream_callback = None
+            if callback_mode and input_stage is self.input_stages[0]:
+                stream_callback = self._input_callback
+            elif callback_mode:
+                stream_callback = input_stage.stream_callback
+
+            input_stage.stream = self.audio_backend.open_stream(
+                sample_format=input_stage.converter.sample_format,
+                channels=1,
+                rate=self._get_device_rate(input_stage.sample_rate),
+                input=True,
+                input_device_index=input_stage.device_index,
+                frames_per_buffer=self._get_device_block_size(input_stage.sample_rate),
+                stream_callback=stream_callback,
+            )
+
+    def _start_outputs(self, callback_mode=False):
+        for output_stage in self.get_output_stages():
+            output_stage.stream = self.audio_backend.open_stream(
+                sample_format=output_stage.converter.sample_format,
+                channels=self.channels,
+                rate=self._get_device_rate(output_stage.sample_rate),
+                output=True,
+                output_device_index=output_stage.device_index,
+                frames_per_buffer=self._get_device_block_size(output_stage.sample_rate),
+                stream_callback=output_stage.stream_callback if callback_mode else None,
+            )
 
-    def _stop_output_1(self):
-        self.audio_output_1.stop_stream()
-        self.audio_output_1.close()
+    def _stop_inputs(self):
+        for input_stage in self.input_stages:
+            self.audio_backend.release_stream(input_stage.stream)
 
-    def _stop_output_2(self):
-        self.audio_output_2.stop_stream()
-        self.audio_output_2.close()
+    def _stop_outputs(self):
+        for output_stage in self.get_output_stages():
+            self.audio_backend.release_stream(output_stage.stream)
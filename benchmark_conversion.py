@@ -0,0 +1,44 @@
+import struct
+import timeit
+import numpy as np
+from Int16Converter import Int16Converter
+
+block_sizes = [64, 256, 1024, 44100]
+repeats = 20
+
+
+def struct_round_trip(data):
+    samples = np.array(struct.unpack(f"{len(data)//2}h", data), dtype=np.float32)
+    return struct.pack(f"{len(samples)}h", *np.array(samples, dtype=np.int16))
+
+
+def buffer_round_trip(converter, data):
+    samples = converter.decode(data)
+    return converter.encode(samples)
+
+
+print(f"{'block':>8} {'struct, us':>12} {'buffer, us':>12} {'speedup':>8}")
+
+for block_size in block_sizes:
+    samples = np.random.randint(-32768, 32767, block_size, dtype=np.int16)
+    data = samples.tobytes()
+    converter = Int16Converter(block_size)
+
+    assert struct_round_trip(data) == buffer_round_trip(converter, data)
+
+    number = max(1, 100000 // block_size)
+    struct_time = min(
+        timeit.repeat(lambda: struct_round_trip(data), number=number, repeat=repeats)
+    )
+    buffer_time = min(
+        timeit.repeat(
+            lambda: buffer_round_trip(converter, data), number=number, repeat=repeats
+        )
+    )
+
+    struct_time = struct_time / number * 1e6
+    buffer_time = buffer_time / number * 1e6
+    print(
+        f"{block_size:>8} {struct_time:>12.2f} {buffer_time:>12.2f} "
+        f"{struct_time / buffer_time:>7.1f}x"
+    )
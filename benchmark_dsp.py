@@ -0,0 +1,244 @@
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+from pedalboard import Pedalboard, Reverb
+from VirtualMicroDevice import VirtualMicroDevice
+from BackgroundTrack import BackgroundTrack
+from ConvolutionReverb import ConvolutionReverb
+from EffectChain import EffectChain, load_preset
+from Int16Converter import Int16Converter
+from Float32Converter import Float32Converter
+
+sample_rate = 44100
+# the pipeline runs only at the block sizes the device accepts (64 to 1024),
+# the other stages also at the old one second chunk
+block_sizes = [64, 128, 256, 512, 1024, 4096, 44100]
+
+# impulse response lengths for the convolution stages (seconds)
+impulse_response_durations = [0.1, 0.5, 1, 3, 10]
+
+
+def create_device(block_size, channels):
+    device = VirtualMicroDevice(
+        input_device_index=None,
+        output_device_index=None,
+        second_output_device_index=None,
+        sample_rate=sample_rate,
+        block_size=block_size,
+        channels=channels,
+    )
+
+    # Every stage of the chain enabled, on both outputs
+    device.set_second_output_device_enabled(True)
+    device.set_routing_matrix([[1, 1, 1], [1, 1, 1]])
+    device.set_noise_threshold(0.01)
+    device.set_denoiser_enabled(True)
+    device.set_reverb_enabled(True)
+    device.set_audio_reverb_enabled(True)
+    device.set_background_audio_volume(0.7)
+
+    # A one second impulse response, decoded files are not needed
+    device.impulse_response = create_impulse_response(1.0)
+    device._create_convolution_reverb(device.input_stages[0])
+    device.set_convolution_enabled(True)
+
+    # Ten seconds of synthetic background audio
+    t = np.arange(10 * sample_rate) / sample_rate
+    background_audio = np.sin(2 * np.pi * 220 * t).astype(np.float32)
+    device.playlist.add_track(BackgroundTrack(background_audio, channels=channels))
+    device.background_track = device.playlist
+
+    return device
+
+
+def create_impulse_response(duration):
+    # Exponentially decaying noise, like a room impulse response
+    length = int(duration * sample_rate)
+    impulse_response = np.random.default_rng(1).normal(0, 1, length)
+    impulse_response *= np.exp(-6.9 * np.arange(length) / length)
+    return impulse_response.astype(np.float32)
+
+
+def create_stages(block_size, channels=1):
+    device = create_device(block_size, channels)
+    int16_converter = Int16Converter(block_size, channels)
+    float32_converter = Float32Converter(block_size, channels)
+
+    # Planar float32 at full scale, as the pipeline sees it
+    float_data = np.random.default_rng(0).normal(0, 0.1, (channels, block_size))
+    float_data = np.clip(float_data, -1, 1).astype(np.float32)
+    int16_bytes = int16_converter.encode(float_data)
+    float32_bytes = float32_converter.encode(float_data)
+
+    # The voice input is mono and native float32
+    input_bytes = float_data[0].tobytes()
+
+    # Noise profile learned from the test signal itself
+    device.learn_noise(0.1)
+    denoiser = device.input_stages[0].denoiser
+    while device.is_learning_noise():
+        denoiser.process(float_data[0])
+
+    # CPU cost against the impulse response length
+    convolution_stages = {}
+    for duration in impulse_response_durations:
+        convolution_reverb = ConvolutionReverb(
+            create_impulse_response(duration), sample_rate, block_size, duration
+        )
+        convolution_stages[f"convolution_{duration:g}s"] = (
+            lambda convolution_reverb=convolution_reverb: convolution_reverb.process(
+                float_data[0]
+            )
+        )
+
+    # The native effects of a preset, compiled into one Pedalboard against
+    # one call per plugin
+    effect_chain = EffectChain(load_preset("podcast"), sample_rate)
+    effect_chain.prepare(device.parameters.get_snapshot(), 1)
+    plugins = list(effect_chain.plugins[0].values())
+    effect_board = Pedalboard(plugins)
+    reverb = Pedalboard([Reverb(room_size=0.25)])
+
+    def effect_chain_per_plugin():
+        audio_data = float_data[0]
+        for plugin in plugins:
+            audio_data = plugin(audio_data, sample_rate, reset=False)
+
+    def background_read():
+        device.background_track.read(block_size, device.background_audio_level)
+        device.background_track.advance(block_size)
+
+    stages = {
+        "reduce_noise": lambda: device.reduce_noise(float_data[0], 0.01),
+        "denoiser": lambda: denoiser.process(float_data[0]),
+        "int16_decode": lambda: int16_converter.decode(int16_bytes),
+        "int16_encode": lambda: int16_converter.encode(float_data),
+        "float32_decode": lambda: float32_converter.decode(float32_bytes),
+        "float32_encode": lambda: float32_converter.encode(float_data),
+        "background_read": background_read,
+        "reverb": lambda: reverb(float_data[0], sample_rate, reset=False),
+        "effect_chain": lambda: effect_board(float_data[0], sample_rate, reset=False),
+        "effect_chain_per_plugin": effect_chain_per_plugin,
+        **convolution_stages,
+    }
+
+    # set_block_size() clamps the device, other sizes would measure its
+    # fallback paths instead of the chain
+    if device.block_size == block_size:
+        stages["pipeline"] = lambda: device.process_block(input_bytes, block_size)
+
+    return stages
+
+
+# ----------------------------------------------------------------
+def measure(stage, block_size, min_time=0.2, min_iterations=20):
+    # Warm up caches and lazily allocated buffers
+    for _ in range(3):
+        stage()
+
+    timings = []
+    start_time = time.perf_counter()
+    while len(timings) < min_iterations or time.perf_counter() - start_time < min_time:
+        block_start_time = time.perf_counter()
+        stage()
+        timings.append(time.perf_counter() - block_start_time)
+
+    # Peak of memory allocated while processing one block
+    tracemalloc.start()
+    stage()
+    tracemalloc.reset_peak()
+    current_size, _ = tracemalloc.get_traced_memory()
+    stage()
+    _, peak_size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    block_time = float(np.median(timings))
+    return {
+        "block_size": block_size,
+        "median_us": block_time * 1e6,
+        "p99_us": float(np.percentile(timings, 99)) * 1e6,
+        "realtime_factor": block_size / sample_rate / block_time,
+        "allocated_bytes_per_block": peak_size - current_size,
+    }
+
+
+def run_benchmarks(stage_names=None, sizes=block_sizes, channels=1):
+    results = []
+    for block_size in sizes:
+        for stage_name, stage in create_stages(block_size, channels).items():
+            if stage_names and stage_name not in stage_names:
+                continue
+
+            result = measure(stage, block_size)
+            result["stage"] = stage_name
+            result["channels"] = channels
+            results.append(result)
+
+            print(
+                f"{stage_name:>16} {block_size:>6} "
+                f"{result['median_us']:>10.1f} us "
+                f"{result['realtime_factor']:>9.1f}x "
+                f"{result['allocated_bytes_per_block']:>9} B",
+                flush=True,
+            )
+
+    return results
+
+
+def compare_results(results, previous_results):
+    previous = {(r["stage"], r["block_size"]): r for r in previous_results}
+
+    print("\nChange against the previous run (median time per block):")
+    for result in results:
+        previous_result = previous.get((result["stage"], result["block_size"]))
+        if previous_result is None:
+            continue
+
+        ratio = result["median_us"] / previous_result["median_us"]
+        marker = "  REGRESSION" if ratio > 1.1 else ""
+        print(
+            f"{result['stage']:>16} {result['block_size']:>6} "
+            f"{previous_result['median_us']:>10.1f} -> "
+            f"{result['median_us']:>10.1f} us ({ratio:.2f}x){marker}"
+        )
+
+
+# ----------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the DSP chain")
+    parser.add_argument("--output", help="save results to this JSON file")
+    parser.add_argument("--compare", help="previous JSON results to compare with")
+    parser.add_argument("--stage", action="append", help="only run these stages")
+    parser.add_argument("--block-size", type=int, action="append")
+    parser.add_argument("--channels", type=int, default=1, help="output channels")
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'stage':>16} {'block':>6} {'per block':>13} {'realtime':>10} {'alloc':>11}"
+    )
+    results = run_benchmarks(args.stage, args.block_size or block_sizes, args.channels)
+
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "sample_rate": sample_rate,
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            compare_results(results, json.load(file)["results"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
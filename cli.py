@@ -0,0 +1,405 @@
+import time
+
+process_start_time = time.perf_counter()
+
+import sys
+import json
+import signal
+import argparse
+import threading
+from VirtualMicroDevice import VirtualMicroDevice
+from DeviceManager import get_device_manager
+from ControlServer import ControlServer
+from TelemetryServer import TelemetryServer
+from settings import DEFAULT_CONFIG, apply_settings, load_effects
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Headless virtual micro device")
+
+    parser.add_argument("--config", help="JSON config file, flags override it")
+    parser.add_argument("--input", help="input device name, ID or index")
+    parser.add_argument("--output", help="1st output device name, ID or index")
+    parser.add_argument("--second-output", help="2nd output device name, ID or index")
+    parser.add_argument(
+        "--extra-input", dest="extra_inputs", action="append", help="repeatable"
+    )
+    parser.add_argument(
+        "--extra-output", dest="extra_outputs", action="append", help="repeatable"
+    )
+    parser.add_argument("--sample-rate", type=int)
+    parser.add_argument("--channels", type=int, help="output channels, 1 or 2")
+    for device in ["input", "output", "second-output"]:
+        parser.add_argument(
+            f"--{device}-sample-rate",
+            help="device rate, resampled to --sample-rate, or 'native'",
+        )
+    parser.add_argument("--block-size", type=int)
+    parser.add_argument("--latency", type=float, help="target latency, seconds")
+    parser.add_argument(
+        "--blocking",
+        dest="callback_mode",
+        action="store_false",
+        default=None,
+        help="use the blocking read/write loop",
+    )
+    parser.add_argument(
+        "--jitter-buffer-depth", type=int, help="blocks an output may fall behind"
+    )
+    parser.add_argument(
+        "--background-audio", action="append", help="background track, repeatable"
+    )
+    parser.add_argument("--background-audio-volume", type=float)
+    parser.add_argument("--crossfade", type=float, help="crossfade, seconds")
+    parser.add_argument(
+        "--clip",
+        dest="clips",
+        type=parse_clip,
+        action="append",
+        help="soundboard clip as name=file, repeatable",
+    )
+    parser.add_argument("--soundboard-memory-mb", type=float)
+    parser.add_argument("--noise-threshold", type=float, help="full scale, 0 to 0.1")
+    parser.add_argument(
+        "--denoiser",
+        action="store_true",
+        default=None,
+        help="spectral denoiser, learn the noise with the learn_noise command",
+    )
+    parser.add_argument("--denoiser-strength", type=float, help="0 to 1")
+    parser.add_argument(
+        "--impulse-response", help="room or cabinet impulse response file"
+    )
+    parser.add_argument("--convolution-mix", type=float, help="wet share, 0 to 1")
+    parser.add_argument(
+        "--effect-preset", help="voice effect chain, a preset name or JSON file"
+    )
+    parser.add_argument("--reverb", action="store_true", default=None)
+    parser.add_argument("--audio-reverb", action="store_true", default=None)
+    parser.add_argument("--reverb-room-size", type=float)
+    parser.add_argument(
+        "--reverb-cache-mb",
+        type=float,
+        help="memory for the background rendered with reverb, 0 keeps it live",
+    )
+    parser.add_argument(
+        "--routing",
+        type=json.loads,
+        help="JSON gain matrix, rows: output, 2nd output, extra outputs; "
+        "columns: input, extra inputs, background audio, soundboard",
+    )
+    parser.add_argument("--record", help="directory for recordings of the 1st output")
+    parser.add_argument("--record-format", choices=["wav", "flac"])
+    parser.add_argument(
+        "--record-rotate-seconds", type=float, help="start a new file after this"
+    )
+    parser.add_argument(
+        "--record-rotate-mb", type=float, help="start a new file at this size"
+    )
+    parser.add_argument(
+        "--no-translate-first",
+        dest="translate_first",
+        action="store_false",
+        default=None,
+    )
+    parser.add_argument("--translate-second", action="store_true", default=None)
+    parser.add_argument("--play-first", action="store_true", default=None)
+    parser.add_argument("--play-second", action="store_true", default=None)
+    parser.add_argument(
+        "--control-port", type=int, help="localhost control port, 0 disables it"
+    )
+    parser.add_argument(
+        "--telemetry-port",
+        type=int,
+        help="localhost HTTP port for /telemetry and /metrics, 0 disables it",
+    )
+
+    return parser.parse_args(argv)
+
+
+def parse_clip(value):
+    name, separator, file_path = value.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError("expected name=file")
+    return name, file_path
+
+
+def load_config(args):
+    config = dict(DEFAULT_CONFIG)
+
+    if args.config:
+        with open(args.config, "r") as file:
+            config.update(json.load(file))
+
+    for key, value in vars(args).items():
+        if key != "config" and value is not None:
+            config[key] = value
+
+    return config
+
+
+# ----------------------------------------------------------------
+def resolve_sample_rate(rate, device_index):
+    # None keeps the engine rate, "native" is the device default rate
+    if rate is None:
+        return None
+    if str(rate).lower() == "native":
+        return int(
+            get_device_manager().get_devices()[device_index]["defaultSampleRate"]
+        )
+    return int(rate)
+
+
+def create_device(config):
+    device_manager = get_device_manager()
+
+    input_device_index = device_manager.resolve_input_device(
+        config["input"] or device_manager.get_default_input_device_id()
+    )
+    output_device_index = device_manager.resolve_output_device(
+        config["output"] or device_manager.get_default_output_device_id()
+    )
+
+    device = VirtualMicroDevice(
+        input_device_index=input_device_index,
+        output_device_index=output_device_index,
+        second_output_device_index=None,
+        sample_rate=config["sample_rate"],
+        block_size=config["block_size"],
+        latency=config["latency"],
+        callback_mode_enabled=config["callback_mode"],
+        channels=config["channels"],
+        input_sample_rate=resolve_sample_rate(
+            config["input_sample_rate"], input_device_index
+        ),
+        output_sample_rate=resolve_sample_rate(
+            config["output_sample_rate"], output_device_index
+        ),
+    )
+    device.set_jitter_buffer_depth(config["jitter_buffer_depth"])
+
+    if config["second_output"]:
+        second_output_device_index = device_manager.resolve_output_device(
+            config["second_output"]
+        )
+        device.set_second_output_device_index(second_output_device_index)
+        device.set_second_output_sample_rate(
+            resolve_sample_rate(
+                config["second_output_sample_rate"], second_output_device_index
+            )
+        )
+        device.set_second_output_device_enabled(True)
+
+    for extra_input in config["extra_inputs"]:
+        device.add_input_device(device_manager.resolve_input_device(extra_input))
+
+    for extra_output in config["extra_outputs"]:
+        device.add_output_device(device_manager.resolve_output_device(extra_output))
+
+    for i, file_path in enumerate(config["background_audio"]):
+        if i == 0:
+            device.load_background_audio(file_path)
+        else:
+            device.add_background_audio(file_path)
+
+    device.set_reverb_cache_memory_budget(config["reverb_cache_mb"] * 1024**2)
+
+    load_effects(device, config)
+
+    # Clips are decoded now, so triggering them never waits for a file
+    device.set_soundboard_memory_budget(config["soundboard_memory_mb"] * 1024**2)
+    for name, file_path in dict(config["clips"]).items():
+        device.load_clip(name, file_path)
+
+    apply_settings(device, config)
+
+    if config["record"]:
+        start_recording(device, config, config["record"])
+
+    return device
+
+
+def start_recording(device, config, directory):
+    max_file_bytes = None
+    if config["record_rotate_mb"]:
+        max_file_bytes = int(config["record_rotate_mb"] * 1024**2)
+
+    device.start_recording(
+        directory,
+        file_format=config["record_format"],
+        max_file_seconds=config["record_rotate_seconds"],
+        max_file_bytes=max_file_bytes,
+    )
+
+
+def get_status(device):
+    position, length = device.get_background_audio_time()
+
+    return {
+        "running": device.is_running,
+        "latency": device.get_stream_latency(),
+        "time_to_first_audio": device.get_time_to_first_audio(),
+        "background_audio_position": position,
+        "background_audio_length": length,
+    }
+
+
+def handle_command(device, config, command, stop_event):
+    name, _, argument = command.partition(" ")
+    argument = argument.strip()
+
+    if name == "status":
+        return get_status(device)
+
+    if name == "telemetry":
+        return device.get_telemetry()
+
+    if name == "stop":
+        stop_event.set()
+        return None
+
+    if name == "learn_noise":
+        # "learn_noise 2" learns the noise profile from the next 2 seconds
+        device.learn_noise(float(argument or 1.0))
+        return None
+
+    if name == "play":
+        # "play airhorn 0.5" triggers a clip at half gain
+        clip_name, _, gain = argument.partition(" ")
+        device.trigger_clip(clip_name, float(gain or 1.0))
+        return None
+
+    if name == "stop_clips":
+        device.stop_clips()
+        return None
+
+    if name == "clip":
+        # "clip airhorn sounds/airhorn.wav" loads a clip into the soundboard
+        clip_name, _, file_path = argument.partition(" ")
+        device.load_clip(clip_name, file_path.strip())
+        return None
+
+    if name == "record":
+        # "record recordings" writes the 1st output to recordings/
+        start_recording(device, config, argument or config["record"] or "recordings")
+        return None
+
+    if name == "stop_recording":
+        device.stop_recording()
+        return None
+
+    if name == "load_ir":
+        # "load_ir rooms/hall.wav" loads an impulse response and enables it
+        device.load_impulse_response(argument)
+        device.set_convolution_enabled(True)
+        return None
+
+    if name == "preset":
+        # "preset podcast" switches the voice effect chain
+        device.load_effect_preset(argument)
+        return None
+
+    if name == "load":
+        device.load_background_audio(argument)
+        return None
+
+    if name == "add":
+        device.add_background_audio(argument)
+        return None
+
+    if name == "set":
+        # "set noise_threshold 0.01" calls device.set_noise_threshold(0.01),
+        # "set routing_matrix [[1, 0], [0, 1]]" sets all gains at once
+        parameter, _, value = argument.partition(" ")
+        setter = getattr(device, f"set_{parameter}", None)
+        if setter is None:
+            raise ValueError(f"Unknown parameter: {parameter}")
+
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+
+        setter(value)
+        return None
+
+    raise ValueError(f"Unknown command: {name}")
+
+
+# ----------------------------------------------------------------
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args)
+
+    device = create_device(config)
+    stop_event = threading.Event()
+
+    def stop(signum, frame):
+        stop_event.set()
+
+    def reload(signum, frame):
+        # Reapply effect and routing settings from the config file
+        apply_settings(device, load_config(args))
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, reload)
+
+    control_server = None
+    if config["control_port"]:
+        control_server = ControlServer(
+            lambda command: handle_command(device, config, command, stop_event),
+            port=config["control_port"],
+        )
+        control_server.start()
+
+    telemetry_server = None
+    if config["telemetry_port"]:
+        telemetry_server = TelemetryServer(
+            device.get_telemetry, port=config["telemetry_port"]
+        )
+        telemetry_server.start()
+
+    device.start()
+
+    # Report how long it took from process start to the first processed block;
+    # an engine that fails to open its streams ends its thread before that
+    while device.first_audio_time is None and not stop_event.wait(0.001):
+        if not device.thread.is_alive():
+            break
+
+    if device.first_audio_time is not None:
+        print(
+            "Time to first audio: "
+            f"{(device.first_audio_time - process_start_time) * 1000:.1f} ms",
+            flush=True,
+        )
+
+    # Time out regularly so signals are handled on Windows too
+    while device.thread.is_alive() and not stop_event.wait(0.5):
+        pass
+
+    exit_code = 0
+    if not stop_event.is_set():
+        print("Audio engine stopped unexpectedly", file=sys.stderr, flush=True)
+        exit_code = 1
+
+    device.stop()
+
+    # Buffered blocks are written before the files are closed
+    for output in range(len(device.output_stages)):
+        device.stop_recording(output)
+
+    if control_server is not None:
+        control_server.stop()
+
+    if telemetry_server is not None:
+        telemetry_server.stop()
+
+    get_device_manager().terminate()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
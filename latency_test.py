@@ -0,0 +1,165 @@
+import sys
+import json
+import argparse
+import numpy as np
+from VirtualMicroDevice import VirtualMicroDevice
+from LoopbackBackend import LoopbackBackend
+
+sample_rate = 44100
+impulse_value = 20000
+
+
+def create_impulses(duration, interval, device_rate):
+    input_data = np.zeros(int(duration * device_rate), dtype=np.int16)
+    impulse_positions = np.arange(
+        int(0.1 * device_rate), len(input_data), int(interval * device_rate)
+    )
+    input_data[impulse_positions] = impulse_value
+    return input_data, impulse_positions
+
+
+def measure_latency(
+    block_size, callback_mode, latency, realtime, duration, interval, device_rate=None
+):
+    # Devices may run at another rate than the engine, see StreamResampler
+    device_rate = device_rate or sample_rate
+
+    input_data, impulse_positions = create_impulses(duration, interval, device_rate)
+    backend = LoopbackBackend(input_data, device_rate)
+
+    # Plain pass-through, so the impulses come out unchanged
+    device = VirtualMicroDevice(
+        input_device_index=0,
+        output_device_index=1,
+        second_output_device_index=2,
+        sample_rate=sample_rate,
+        block_size=block_size,
+        latency=latency,
+        callback_mode_enabled=callback_mode,
+        audio_backend=backend,
+        input_sample_rate=device_rate,
+        output_sample_rate=device_rate,
+        second_output_sample_rate=device_rate,
+    )
+    device.set_voice_gain(0, 0, 1)
+
+    device.start()
+    backend.wait_for_streams(2)
+    device_block_size = device._get_device_block_size(device_rate)
+    backend.run(
+        int(np.ceil(len(input_data) / device_block_size)) + 64, realtime=realtime
+    )
+    backend.finish()
+    device.stop()
+
+    output_data = backend.get_output(1)
+    # Resampling spreads an impulse a little, take the first sample above half
+    output_positions = np.flatnonzero(np.abs(output_data) > impulse_value // 2)
+    output_positions = output_positions[np.diff(output_positions, prepend=-2) > 1]
+
+    # Match every input impulse with the first output impulse after it
+    latencies = []
+    for position in impulse_positions:
+        index = np.searchsorted(output_positions, position)
+        if index < len(output_positions):
+            next_position = impulse_positions[impulse_positions > position]
+            if len(next_position) and output_positions[index] >= next_position[0]:
+                continue
+            latencies.append(output_positions[index] - position)
+
+    latencies = np.array(latencies) / device_rate * 1000
+    return {
+        "block_size": block_size,
+        "mode": "callback" if callback_mode else "blocking",
+        "latency_target_ms": latency * 1000,
+        "reported_latency_ms": device.get_stream_latency()["total"] * 1000,
+        "measured_latency_ms": float(np.mean(latencies)) if len(latencies) else None,
+        "jitter_ms": float(np.ptp(latencies)) if len(latencies) else None,
+        "lost_impulses": int(len(impulse_positions) - len(latencies)),
+        "dropped_blocks": backend.get_dropped_block_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure input-to-output latency on the in-memory loopback"
+    )
+    parser.add_argument("--block-size", type=int, action="append")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds")
+    parser.add_argument(
+        "--device-rate", type=int, help="sample rate of the loopback devices"
+    )
+    parser.add_argument(
+        "--realtime", action="store_true", help="pace the clock like a sound card"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.0,
+        help="largest difference of measured and reported latency (ms)",
+    )
+    parser.add_argument("--output", help="save results to this JSON file")
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'mode':>9} {'block':>6} {'reported':>10} {'measured':>10} "
+        f"{'jitter':>8} {'lost':>5} {'dropped':>8}"
+    )
+
+    results = []
+    for callback_mode in [True, False]:
+        for block_size in args.block_size or [64, 128, 256, 512, 1024]:
+            result = measure_latency(
+                block_size,
+                callback_mode,
+                args.latency,
+                args.realtime,
+                args.duration,
+                args.interval,
+                args.device_rate,
+            )
+            results.append(result)
+
+            measured = result["measured_latency_ms"]
+            jitter = result["jitter_ms"]
+            print(
+                f"{result['mode']:>9} {block_size:>6} "
+                f"{result['reported_latency_ms']:>7.1f} ms "
+                f"{measured if measured is not None else float('nan'):>7.1f} ms "
+                f"{jitter if jitter is not None else float('nan'):>5.1f} ms "
+                f"{result['lost_impulses']:>5} {result['dropped_blocks']:>8}",
+                flush=True,
+            )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    # A paced clock may drop blocks on a busy machine, only the simulated
+    # clock is exact enough to fail a CI run
+    if not args.realtime:
+        failures = [result for result in results if not is_exact(result, args)]
+        for result in failures:
+            print(
+                f"FAILED: {result['mode']} at block size {result['block_size']}",
+                file=sys.stderr,
+            )
+        return 1 if failures else 0
+
+    return 0
+
+
+def is_exact(result, args):
+    measured = result["measured_latency_ms"]
+    return (
+        result["lost_impulses"] == 0
+        and result["dropped_blocks"] == 0
+        and measured is not None
+        and abs(measured - result["reported_latency_ms"]) <= args.tolerance
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
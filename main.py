@@ -1,20 +1,39 @@
+import os
+import argparse
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import filedialog
 from VirtualMicroDevice import VirtualMicroDevice
+from RemoteDevice import RemoteDevice
+from TelemetryServer import TelemetryServer
+from EffectChain import get_preset_names
+from DeviceManager import get_device_manager
 
 
 class VirtualMicroGUI(tk.Frame):
-    def __init__(self, master=None):
+    def __init__(self, master=None, engine_process=False, telemetry_port=7701):
         super().__init__(master)
 
         self.master = master
 
         self.master.protocol("WM_DELETE_WINDOW", self._on_closing)
 
-        self.input_device_index = tk.StringVar(value="1")  # Microphone
-        self.output_device_1_index = tk.StringVar(value="6")  # Cable input
-        self.output_device_2_index = tk.StringVar(value="5")  # Headphones
+        self.device_manager = get_device_manager()
+
+        # Devices are selected by stable "host api: name" IDs
+        default_output_device = self.device_manager.get_default_output_device_id()
+
+        self.input_device_index = tk.StringVar(
+            value=self.device_manager.get_default_input_device_id()
+        )  # Microphone
+        self.output_device_1_index = tk.StringVar(
+            value=self.device_manager.find_output_device_id(
+                "CABLE Input", default_output_device
+            )
+        )  # Cable input
+        self.output_device_2_index = tk.StringVar(
+            value=default_output_device
+        )  # Headphones
 
         self.second_output_device_enabled = tk.BooleanVar(value=False)
 
@@ -22,7 +41,18 @@ class VirtualMicroGUI(tk.Frame):
         self.translate_sound_to_second_device_flag = tk.BooleanVar(value=False)
 
         # Noise gate
-        self.noise_threshold = tk.IntVar(value=0)
+        self.noise_threshold = tk.DoubleVar(value=0)
+
+        # Spectral denoiser
+        self.denoiser_enabled = tk.BooleanVar(value=False)
+        self.denoiser_strength = tk.DoubleVar(value=1.0)
+
+        # Convolution with an impulse response
+        self.convolution_enabled = tk.BooleanVar(value=False)
+        self.convolution_mix = tk.DoubleVar(value=0.5)
+
+        # Order and settings of the voice effects
+        self.effect_preset = tk.StringVar(value="default")
 
         # Reverberation
         self.reverb_enabled = tk.BooleanVar(value=False)
@@ -34,14 +64,42 @@ class VirtualMicroGUI(tk.Frame):
         self.play_audio_on_second_device_flag = tk.BooleanVar(value=False)
         self.audio_volume = tk.DoubleVar(value=0.7)
         self.audio_position = tk.IntVar(value=0)
+        self.crossfade_duration = tk.DoubleVar(value=0)
+        self.playlist_info = tk.StringVar(value="Tracks: 0")
+
+        # Soundboard clips, triggered with F1-F12
+        self.clip_names = []
+        self.clips_info = tk.StringVar(value="No clips")
 
-        self.device = VirtualMicroDevice(
+        # Devices are resolved when the device starts
+        device_arguments = dict(
             background_audio_file=None,
-            input_device_index=self.input_device_index,
-            output_device_index=self.output_device_1_index,
-            second_output_device_index=self.output_device_2_index,
+            input_device_index=None,
+            output_device_index=None,
+            second_output_device_index=None,
         )
 
+        # The engine may run in a separate process, then window dragging and
+        # redraws never delay the audio thread
+        self.engine_process = engine_process
+        if engine_process:
+            self.device = RemoteDevice(**device_arguments)
+        else:
+            self.device = VirtualMicroDevice(**device_arguments)
+
+        # The same JSON and Prometheus endpoints as the CLI, on localhost;
+        # a port taken by another instance leaves only the window display
+        self.telemetry_server = None
+        if telemetry_port:
+            telemetry_server = TelemetryServer(
+                self.device.get_telemetry, port=telemetry_port
+            )
+            try:
+                telemetry_server.start()
+                self.telemetry_server = telemetry_server
+            except OSError as error:
+                messagebox.showwarning("Warning", f"Telemetry is not served: {error}")
+
         self.master.columnconfigure(0, weight=1)
         self.master.rowconfigure(0, weight=1)
 
@@ -57,6 +115,7 @@ class VirtualMicroGUI(tk.Frame):
         self._create_device_index_section()
         self._create_effects_section()
         self._create_background_audio_section()
+        self._create_soundboard_section()
         self._create_start_stop_section()
 
     # ----------------------------------------------------------------
@@ -83,19 +142,27 @@ class VirtualMicroGUI(tk.Frame):
         )
         self.enable_second_output_device_checkbutton.grid(row=3, column=0)
 
-        self.input_device_entry = tk.Entry(
-            section, textvariable=self.input_device_index
+        input_devices = [
+            info["id"] for info in self.device_manager.get_input_devices()
+        ] or [""]
+        output_devices = [
+            info["id"] for info in self.device_manager.get_output_devices()
+        ] or [""]
+
+        self.input_device_entry = tk.OptionMenu(
+            section, self.input_device_index, *input_devices
         )
         self.input_device_entry.grid(row=1, column=1, sticky="e")
 
-        self.output_device_entry_1 = tk.Entry(
-            section, textvariable=self.output_device_1_index
+        self.output_device_entry_1 = tk.OptionMenu(
+            section, self.output_device_1_index, *output_devices
         )
         self.output_device_entry_1.grid(row=2, column=1, sticky="e")
 
-        self.output_device_entry_2 = tk.Entry(
-            section, textvariable=self.output_device_2_index, state="disabled"
+        self.output_device_entry_2 = tk.OptionMenu(
+            section, self.output_device_2_index, *output_devices
         )
+        self.output_device_entry_2["state"] = "disabled"
         self.output_device_entry_2.grid(row=3, column=1, sticky="e")
 
     # ----------------------------------------------------------------
@@ -136,30 +203,56 @@ class VirtualMicroGUI(tk.Frame):
         self.noise_threshold_scale = tk.Scale(
             section,
             from_=0,
-            to=3000,
+            to=0.1,
             orient="horizontal",
             label="Noise threshold",
             variable=self.noise_threshold,
-            resolution=1,
+            resolution=0.001,
             command=self.update_noise_threshold,
         )
         self.noise_threshold_scale.grid(row=2, column=0, columnspan=2, sticky="ew")
         self.device.set_noise_threshold(self.noise_threshold.get())
 
+        # Spectral denoiser
+        tk.Checkbutton(
+            section,
+            text="Spectral denoiser",
+            variable=self.denoiser_enabled,
+            command=self.update_settings,
+        ).grid(row=3, column=0, sticky="w")
+
+        self.learn_noise_button = tk.Button(
+            section, text="Learn noise", command=self.learn_noise
+        )
+        self.learn_noise_button.grid(row=3, column=1, sticky="e")
+
+        self.denoiser_strength_scale = tk.Scale(
+            section,
+            from_=0,
+            to=1,
+            orient="horizontal",
+            label="Denoiser strength",
+            variable=self.denoiser_strength,
+            resolution=0.05,
+            command=self.update_denoiser_strength,
+        )
+        self.denoiser_strength_scale.grid(row=4, column=0, columnspan=2, sticky="ew")
+        self.device.set_denoiser_strength(self.denoiser_strength.get())
+
         # Reverberation
         tk.Checkbutton(
             section,
             text="Reverberation",
             variable=self.reverb_enabled,
             command=self.update_settings,
-        ).grid(row=3, column=0, sticky="w")
+        ).grid(row=5, column=0, sticky="w")
 
         tk.Checkbutton(
             section,
             text="Apply to audio file",
             variable=self.audio_reverb_enabled,
             command=self.update_settings,
-        ).grid(row=3, column=1, sticky="e")
+        ).grid(row=5, column=1, sticky="e")
 
         self.reverb_room_size_scale = tk.Scale(
             section,
@@ -171,7 +264,45 @@ class VirtualMicroGUI(tk.Frame):
             resolution=0.01,
             command=self.update_reverb_room_size,
         )
-        self.reverb_room_size_scale.grid(row=4, column=0, columnspan=2, sticky="ew")
+        self.reverb_room_size_scale.grid(row=6, column=0, columnspan=2, sticky="ew")
+
+        # Convolution with a room or cabinet impulse response
+        self.convolution_checkbutton = tk.Checkbutton(
+            section,
+            text="Convolution",
+            variable=self.convolution_enabled,
+            command=self.update_settings,
+            state="disabled",
+        )
+        self.convolution_checkbutton.grid(row=7, column=0, sticky="w")
+
+        tk.Button(section, text="Load IR", command=self.load_impulse_response).grid(
+            row=7, column=1, sticky="e"
+        )
+
+        self.convolution_mix_scale = tk.Scale(
+            section,
+            from_=0,
+            to=1,
+            orient="horizontal",
+            label="Convolution mix",
+            variable=self.convolution_mix,
+            resolution=0.05,
+            command=self.update_convolution_mix,
+        )
+        self.convolution_mix_scale.grid(row=8, column=0, columnspan=2, sticky="ew")
+        self.device.set_convolution_mix(self.convolution_mix.get())
+
+        # Effect chain preset
+        tk.Label(section, text="Effect preset:").grid(row=9, column=0, sticky="w")
+
+        self.effect_preset_entry = tk.OptionMenu(
+            section,
+            self.effect_preset,
+            *get_preset_names(),
+            command=self.load_effect_preset,
+        )
+        self.effect_preset_entry.grid(row=9, column=1, sticky="e")
 
     # ----------------------------------------------------------------
     def _create_background_audio_section(self):
@@ -236,16 +367,57 @@ class VirtualMicroGUI(tk.Frame):
         self.audio_position_scale.grid(row=4, column=0, columnspan=2, sticky="ew")
         self.audio_position_scale.bind("<B1-Motion>", self.update_audio_position)
 
+        tk.Button(section, text="Add File", command=self.add_audio_file).grid(
+            row=5, column=0, sticky="w"
+        )
+        tk.Label(section, textvariable=self.playlist_info).grid(
+            row=5, column=1, sticky="e"
+        )
+
+        self.crossfade_duration_scale = tk.Scale(
+            section,
+            from_=0.0,
+            to=10.0,
+            orient="horizontal",
+            label="Crossfade, s",
+            variable=self.crossfade_duration,
+            resolution=0.5,
+            command=self.update_crossfade_duration,
+        )
+        self.crossfade_duration_scale.grid(row=6, column=0, columnspan=2, sticky="ew")
+
         self._update_audio_position_scale()
 
         self.device.set_background_audio_volume(self.audio_volume.get())
         self.device.set_background_audio_position(self.audio_position.get())
 
     # ----------------------------------------------------------------
-    def _create_start_stop_section(self):
+    def _create_soundboard_section(self):
         section = tk.Frame(self, borderwidth=2, relief="groove", padx=10, pady=10)
         section.grid(row=3, column=0, sticky="ew")
 
+        section.columnconfigure(1, weight=1)
+
+        self.soundboard_label = tk.Label(section, text="Soundboard")
+        self.soundboard_label.grid(row=0, column=0, columnspan=2, sticky="ew")
+
+        tk.Button(section, text="Add Clip", command=self.add_clip).grid(
+            row=1, column=0, sticky="w"
+        )
+        tk.Button(section, text="Stop Clips (Esc)", command=self.stop_clips).grid(
+            row=1, column=1, sticky="e"
+        )
+        tk.Label(section, textvariable=self.clips_info, wraplength=500).grid(
+            row=2, column=0, columnspan=2, sticky="ew"
+        )
+
+        self.master.bind("<Escape>", lambda event: self.stop_clips())
+
+    # ----------------------------------------------------------------
+    def _create_start_stop_section(self):
+        section = tk.Frame(self, borderwidth=2, relief="groove", padx=10, pady=10)
+        section.grid(row=4, column=0, sticky="ew")
+
         section.rowconfigure(0, weight=1)
 
         section.columnconfigure(1, weight=1)
@@ -260,26 +432,44 @@ class VirtualMicroGUI(tk.Frame):
         )
         self.stop_button.grid(row=0, column=1, sticky="e")
 
+        self.latency_label = tk.Label(section, text="Latency: -")
+        self.latency_label.grid(row=1, column=0, columnspan=2, sticky="ew")
+
+        self.telemetry_label = tk.Label(section, text="CPU: -")
+        self.telemetry_label.grid(row=2, column=0, columnspan=2, sticky="ew")
+
+        self.record_button = tk.Button(
+            section, text="Record", command=self.toggle_recording, width=20
+        )
+        self.record_button.grid(row=3, column=0, columnspan=2)
+
+        self._update_latency_label()
+
     # ----------------------------------------------------------------
     def update_settings(self):
         self.device.set_second_output_device_enabled(
             self.second_output_device_enabled.get()
         )
+        self.device.set_denoiser_enabled(self.denoiser_enabled.get())
+        self.device.set_convolution_enabled(self.convolution_enabled.get())
         self.device.set_reverb_enabled(self.reverb_enabled.get())
         self.device.set_audio_reverb_enabled(self.audio_reverb_enabled.get())
 
-        self.device.set_translate_sound_to_first_device_flag(
-            self.translate_sound_to_first_device_flag.get()
+        # Checkboxes switch the gains of the routing matrix, clips go where
+        # the voice goes
+        for output, flag in enumerate(
+            [
+                self.translate_sound_to_first_device_flag.get(),
+                self.translate_sound_to_second_device_flag.get(),
+            ]
+        ):
+            self.device.set_voice_gain(output, 0, float(flag))
+            self.device.set_soundboard_gain(output, float(flag))
+        self.device.set_background_gain(
+            0, float(self.play_audio_on_first_device_flag.get())
         )
-        self.device.set_translate_sound_to_second_device_flag(
-            self.translate_sound_to_second_device_flag.get()
-        )
-
-        self.device.set_play_audio_on_first_device_flag(
-            self.play_audio_on_first_device_flag.get()
-        )
-        self.device.set_play_audio_on_second_device_flag(
-            self.play_audio_on_second_device_flag.get()
+        self.device.set_background_gain(
+            1, float(self.play_audio_on_second_device_flag.get())
         )
 
         if self.second_output_device_enabled.get():
@@ -298,7 +488,53 @@ class VirtualMicroGUI(tk.Frame):
             self.play_audio_on_second_device_flag.set(value=False)
 
     def update_noise_threshold(self, threshold):
-        self.device.set_noise_threshold(int(threshold))
+        self.device.set_noise_threshold(float(threshold))
+
+    def update_denoiser_strength(self, strength):
+        self.device.set_denoiser_strength(float(strength))
+
+    def learn_noise(self):
+        if not self.device.is_running:
+            messagebox.showwarning("Error", "Device is not running!")
+            return
+
+        # Keep quiet while the noise profile is captured
+        self.device.learn_noise()
+        self.learn_noise_button["state"] = "disabled"
+        self.learn_noise_button["text"] = "Learning..."
+        self._update_learn_noise_button()
+
+    def _update_learn_noise_button(self):
+        if self.device.is_learning_noise() and self.device.is_running:
+            self.master.after(100, self._update_learn_noise_button)
+        else:
+            self.learn_noise_button["state"] = "normal"
+            self.learn_noise_button["text"] = "Learn noise"
+
+    def load_impulse_response(self):
+        file_path = filedialog.askopenfilename()
+        if not file_path:
+            return
+
+        try:
+            self.device.load_impulse_response(file_path)
+        except (RuntimeError, ValueError) as error:
+            messagebox.showwarning("Error", str(error))
+            return
+
+        self.convolution_checkbutton["state"] = "normal"
+        self.convolution_enabled.set(True)
+        self.update_settings()
+
+    def load_effect_preset(self, name):
+        try:
+            self.device.load_effect_preset(name)
+        except (RuntimeError, ValueError) as error:
+            messagebox.showwarning("Error", str(error))
+            self.effect_preset.set(self.device.get_effect_preset_name())
+
+    def update_convolution_mix(self, mix):
+        self.device.set_convolution_mix(float(mix))
 
     def update_reverb_room_size(self, room_size):
         self.device.set_reverb_room_size(float(room_size))
@@ -309,6 +545,56 @@ class VirtualMicroGUI(tk.Frame):
             self.background_audio_file.set(file_path)
             self.device.load_background_audio(file_path)
 
+    def add_audio_file(self):
+        file_path = filedialog.askopenfilename()
+        if file_path:
+            if not self.device.get_background_track_count():
+                self.background_audio_file.set(file_path)
+            self.device.add_background_audio(file_path)
+
+    def add_clip(self, file_path=None):
+        if len(self.clip_names) >= 12:
+            messagebox.showwarning("Error", "All hotkeys are taken!")
+            return
+
+        file_path = file_path or filedialog.askopenfilename()
+        if not file_path:
+            return
+
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        try:
+            self.device.load_clip(name, file_path)
+        except (RuntimeError, ValueError) as error:
+            messagebox.showwarning("Error", str(error))
+            return
+
+        if name not in self.clip_names:
+            self.clip_names.append(name)
+
+        hotkey = f"F{self.clip_names.index(name) + 1}"
+        self.master.bind(f"<{hotkey}>", lambda event: self.device.trigger_clip(name))
+
+        self.clips_info.set(
+            ", ".join(f"F{i + 1}: {name}" for i, name in enumerate(self.clip_names))
+        )
+
+    def stop_clips(self):
+        self.device.stop_clips()
+
+    def toggle_recording(self):
+        if self.device.is_recording():
+            self.device.stop_recording()
+            self.record_button["text"] = "Record"
+            return
+
+        directory = filedialog.askdirectory()
+        if directory:
+            self.device.start_recording(directory)
+            self.record_button["text"] = "Stop Recording"
+
+    def update_crossfade_duration(self, value):
+        self.device.set_crossfade_duration(float(value))
+
     def update_audio_volume(self, value):
         self.device.set_background_audio_volume(float(value))
 
@@ -321,8 +607,43 @@ class VirtualMicroGUI(tk.Frame):
 
         self.audio_position_scale.set(current_position)
 
+        position, length = self.device.get_background_audio_time()
+        self.playlist_info.set(
+            f"Tracks: {self.device.get_background_track_count()}, "
+            f"{int(position // 60):02}:{int(position % 60):02} / "
+            f"{int(length // 60):02}:{int(length % 60):02}"
+        )
+
         self.master.after(100, self._update_audio_position_scale)
 
+    def _update_latency_label(self):
+        if self.device.is_running:
+            latency = self.device.get_stream_latency()
+            self.latency_label["text"] = (
+                f"Latency: input {latency['input'] * 1000:.1f} ms, "
+                f"output {latency['outputs'][0] * 1000:.1f} ms, "
+                f"denoiser {latency['denoiser'] * 1000:.1f} ms, "
+                f"total {latency['total'] * 1000:.1f} ms"
+            )
+
+            telemetry = self.device.get_telemetry()
+            counters = telemetry["counters"]
+            xruns = counters["input_overflows"] + sum(
+                output["underflows"] + output["dropped"]
+                for output in telemetry["outputs"]
+            )
+            errors = counters["process_exceptions"] + counters["write_exceptions"]
+            self.telemetry_label["text"] = (
+                f"CPU: {telemetry['budget_usage'] * 100:.0f}% "
+                f"(max {telemetry['budget_usage_max'] * 100:.0f}%), "
+                f"xruns: {xruns}, errors: {errors}"
+            )
+        else:
+            self.latency_label["text"] = "Latency: -"
+            self.telemetry_label["text"] = "CPU: -"
+
+        self.master.after(500, self._update_latency_label)
+
     # ----------------------------------------------------------------
     def set_styles(self):
         root.resizable(True, False)
@@ -357,6 +678,7 @@ class VirtualMicroGUI(tk.Frame):
             self.devices_label,
             self.audio_effects_label,
             self.audio_file_label,
+            self.soundboard_label,
         ]:
             widget.configure(font=(family, 16))
         else:
@@ -383,12 +705,18 @@ class VirtualMicroGUI(tk.Frame):
             return
 
         try:
-            input_index = int(self.input_device_index.get())
-            output_1_index = int(self.output_device_1_index.get())
-            output_2_index = int(self.output_device_2_index.get())
+            input_index = self.device_manager.resolve_input_device(
+                self.input_device_index.get()
+            )
+            output_1_index = self.device_manager.resolve_output_device(
+                self.output_device_1_index.get()
+            )
+            output_2_index = self.device_manager.resolve_output_device(
+                self.output_device_2_index.get()
+            )
 
         except ValueError:
-            messagebox.showwarning("Error", "Invalid device index!")
+            messagebox.showwarning("Error", "Unknown audio device!")
             return
 
         self.device.set_input_device_index(input_index)
@@ -427,13 +755,37 @@ class VirtualMicroGUI(tk.Frame):
     def _on_closing(self):
         if self.device.is_running:
             self._stop_device()
+        self.device.stop_recording()
+        if self.telemetry_server is not None:
+            self.telemetry_server.stop()
+        if self.engine_process:
+            self.device.close()
+        self.device_manager.terminate()
         self.master.destroy()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Virtual micro device")
+    parser.add_argument(
+        "--engine-process",
+        action="store_true",
+        help="run the audio engine in a separate process",
+    )
+    parser.add_argument(
+        "--telemetry-port",
+        type=int,
+        default=7701,
+        help="local port of the telemetry endpoint, 0 disables it",
+    )
+    args = parser.parse_args()
+
     root = tk.Tk()
     root.title("Virtual Micro Device")
 
-    app = VirtualMicroGUI(master=root)
+    app = VirtualMicroGUI(
+        master=root,
+        engine_process=args.engine_process,
+        telemetry_port=args.telemetry_port,
+    )
 
     root.mainloop()
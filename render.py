@@ -0,0 +1,39 @@
+import os
+import sys
+import json
+import argparse
+from OfflineRenderer import OfflineRenderer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render audio files through the virtual micro effect chain"
+    )
+    parser.add_argument("input", help="input audio file or directory")
+    parser.add_argument("output", help="output WAV file or directory")
+    parser.add_argument("--config", help="JSON config file, the same as for cli.py")
+    parser.add_argument("--workers", type=int, help="processes for a directory")
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.config:
+        with open(args.config, "r") as file:
+            config = json.load(file)
+
+    renderer = OfflineRenderer(config)
+
+    if os.path.isdir(args.input):
+        results = renderer.render_directory(args.input, args.output, args.workers)
+    else:
+        results = [renderer.render_file(args.input, args.output)]
+
+    for result in results:
+        print(
+            f"{result['input']}: {result['duration']:.1f} s of audio "
+            f"in {result['render_time']:.2f} s, "
+            f"realtime factor {result['realtime_factor']:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# Settings shared by the headless CLI and the offline renderer, kept free of
+# audio device imports so offline rendering works without PortAudio
+
+DEFAULT_CONFIG = {
+    "input": None,
+    "output": None,
+    "second_output": None,
+    "extra_inputs": [],
+    "extra_outputs": [],
+    "sample_rate": 44100,
+    "channels": 1,
+    "input_sample_rate": None,
+    "output_sample_rate": None,
+    "second_output_sample_rate": None,
+    "block_size": 256,
+    "latency": 0.02,
+    "callback_mode": True,
+    "jitter_buffer_depth": 4,
+    "background_audio": [],
+    "background_audio_volume": 0.7,
+    "crossfade": 0,
+    "clips": {},
+    "soundboard_memory_mb": 64,
+    "noise_threshold": 0,
+    "denoiser": False,
+    "denoiser_strength": 1.0,
+    "impulse_response": None,
+    "convolution_mix": 0.5,
+    "effect_preset": None,
+    "reverb": False,
+    "audio_reverb": False,
+    "reverb_room_size": 0.25,
+    "reverb_cache_mb": 256,
+    "routing": None,
+    "record": None,
+    "record_format": "wav",
+    "record_rotate_seconds": None,
+    "record_rotate_mb": None,
+    "translate_first": True,
+    "translate_second": False,
+    "play_first": False,
+    "play_second": False,
+    "control_port": 7700,
+    "telemetry_port": 7701,
+}
+
+
+def load_effects(device, config):
+    # Effects that load files, once per device
+    if config["impulse_response"]:
+        device.load_impulse_response(config["impulse_response"])
+
+    if config["effect_preset"]:
+        device.load_effect_preset(config["effect_preset"])
+
+
+def apply_settings(device, config):
+    if config["routing"] is not None:
+        device.set_routing_matrix(config["routing"])
+    else:
+        # Shortcuts for the first input and the first two outputs, clips
+        # go where the voice goes
+        device.set_voice_gain(0, 0, float(config["translate_first"]))
+        device.set_voice_gain(1, 0, float(config["translate_second"]))
+        device.set_soundboard_gain(0, float(config["translate_first"]))
+        device.set_soundboard_gain(1, float(config["translate_second"]))
+        device.set_background_gain(0, float(config["play_first"]))
+        device.set_background_gain(1, float(config["play_second"]))
+
+    device.set_noise_threshold(config["noise_threshold"])
+    device.set_denoiser_enabled(config["denoiser"])
+    device.set_denoiser_strength(config["denoiser_strength"])
+    device.set_convolution_enabled(bool(config["impulse_response"]))
+    device.set_convolution_mix(config["convolution_mix"])
+    device.set_reverb_enabled(config["reverb"])
+    device.set_audio_reverb_enabled(config["audio_reverb"])
+    device.set_reverb_room_size(config["reverb_room_size"])
+
+    device.set_background_audio_volume(config["background_audio_volume"])
+    device.set_crossfade_duration(config["crossfade"])